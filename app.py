@@ -1,14 +1,32 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date, datetime, timedelta
-from io import BytesIO
-import json
+import bisect
+import csv
 import hashlib
+import io
+import math
+import random
+import re
+import tempfile
+import threading
+import time
+import unicodedata
 
 import altair as alt
+import httpx
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
-from supabase import create_client, Client
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from openpyxl import Workbook
+from postgrest import APIError, ReturnMethod
+from supabase import ClientOptions, create_client, Client
 
 st.set_page_config(
     page_title="Gestión de Tareas - Sistema Empresarial", 
@@ -52,6 +70,64 @@ USUARIOS = {
 JEFES_PROYECTO = ["Julio Yroba", "José Quintero", "Matías Riquelme"]
 ESTADOS = ["Pendiente", "En Proceso", "Completada"]
 
+# Segundos entre sincronizaciones incrementales de tareas con Supabase
+TASKS_SYNC_SECONDS = 30
+
+# Margen que se resta a la marca ``updated_at`` al pedir cambios: el trigger
+# usa NOW() (inicio de la transacción), así que una transacción larga puede
+# confirmar una fila con marca anterior a otra ya sincronizada
+TASKS_SYNC_OVERLAP_SECONDS = TASKS_SYNC_SECONDS
+
+# Modo en vivo del Dashboard Gerencia: cada cuánto el hilo de fondo trae
+# cambios de Supabase, cada cuánto cada sesión revisa si hay una versión
+# nueva (solo memoria) y tras cuántos segundos sin espectadores se detiene
+LIVE_POLL_SECONDS = 10
+LIVE_CHECK_SECONDS = 3
+LIVE_IDLE_SECONDS = 300
+
+# Reintentos de una actualización de tarea que se cruzó con otra edición
+TASK_UPDATE_RETRIES = 3
+
+# Tareas por página en la lista de gestión
+TASKS_PAGE_SIZE = 20
+
+# Filas máximas que Supabase devuelve por respuesta (max-rows de PostgREST)
+SUPABASE_MAX_ROWS = 1000
+
+# Filas por consulta al exportar tareas (bajo SUPABASE_MAX_ROWS: la
+# paginación pide una fila extra para saber si hay más) y bytes que se
+# guardan en memoria antes de pasar el archivo a disco
+EXPORT_CHUNK_SIZE = 500
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Filas por INSERT al importar tareas o snapshots
+IMPORT_BATCH_SIZE = 500
+
+# Máximo de resultados (los más relevantes) que devuelve la búsqueda
+SEARCH_MAX_RESULTS = 200
+
+# Origen de los agregados del Dashboard Gerencia:
+# "local" los calcula sobre el almacén de tareas compartido;
+# "rpc" los pide a las funciones SQL de setup_supabase.sql
+DASHBOARD_FUENTE = "local"
+
+# Cache de consultas de KPIs: segundos de vida y rangos guardados
+KPI_CACHE_TTL = 300
+KPI_CACHE_MAX_ENTRIES = 32
+
+# Acceso a Supabase: segundos máximos por llamada, intentos de las lecturas
+# (con espera exponencial desde SUPABASE_BACKOFF_SECONDS) y fallas de red
+# seguidas que abren el circuito durante SUPABASE_CIRCUIT_RESET_SECONDS
+SUPABASE_TIMEOUT_SECONDS = 8
+SUPABASE_RETRIES = 3
+SUPABASE_BACKOFF_SECONDS = 0.25
+SUPABASE_CIRCUIT_FAILURES = 5
+SUPABASE_CIRCUIT_RESET_SECONDS = 30
+SUPABASE_FALLBACK_ENTRIES = 256
+
+# Hilos del proceso para lanzar en paralelo consultas independientes
+CARGA_PARALELA_WORKERS = 8
+
 # Metas de KPIs
 METAS_KPI = {
     "felicitaciones": 2,
@@ -61,6 +137,16 @@ METAS_KPI = {
     "autonomia": 85
 }
 
+# Agrupaciones del histórico de KPIs: etiqueta -> período de pandas
+KPI_ROLLUP_FRECUENCIAS = {"Semana": "W", "Mes": "M", "Trimestre": "Q", "Año": "Y"}
+
+# Metas por período: (vigentes desde, metas). Cada semana se evalúa con la
+# última entrada cuya fecha sea <= a la semana; agregar una entrada nueva al
+# cambiar las metas conserva el cálculo de las semanas anteriores.
+METAS_KPI_PERIODOS = [
+    (date(2000, 1, 1), METAS_KPI),
+]
+
 # ============================================================================
 # CONEXIÓN A SUPABASE
 # ============================================================================
@@ -71,42 +157,401 @@ def get_supabase_client() -> Client:
     try:
         url = st.secrets["supabase"]["url"]
         key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
+        return create_client(url, key, options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_SECONDS))
     except Exception as e:
         st.error(f"Error conectando a Supabase: {e}")
         st.stop()
 
 
+class SupabaseNoDisponible(Exception):
+    """El circuito está abierto: no se intenta llamar a Supabase"""
+
+
+class CircuitBreaker:
+    """Circuito para las llamadas a Supabase compartido por todo el proceso.
+
+    Tras ``max_fallas`` fallas seguidas (de red o 5xx) se abre y las
+    llamadas fallan de inmediato con ``SupabaseNoDisponible``, sin esperar
+    timeouts. Pasados ``reinicio`` segundos deja pasar una llamada de
+    prueba: si resulta se cierra y si falla vuelve a abrirse. Quien obtiene
+    la prueba debe terminar con ``exito``, ``falla`` o ``liberar``.
+    """
+
+    def __init__(self, max_fallas: int, reinicio: float) -> None:
+        self._lock = threading.Lock()
+        self.max_fallas = max_fallas
+        self.reinicio = reinicio
+        self.fallas = 0
+        self.abierto_desde: float | None = None
+        self._probando = False
+
+    @property
+    def abierto(self) -> bool:
+        return self.abierto_desde is not None
+
+    def permitir(self) -> bool:
+        """Indica si se puede llamar ahora (en semiabierto, solo una llamada)"""
+        with self._lock:
+            if self.abierto_desde is None:
+                return True
+            if self._probando or time.monotonic() - self.abierto_desde < self.reinicio:
+                return False
+            self._probando = True
+            return True
+
+    def exito(self) -> None:
+        with self._lock:
+            self.fallas = 0
+            self.abierto_desde = None
+            self._probando = False
+
+    def falla(self) -> None:
+        with self._lock:
+            self.fallas += 1
+            if self._probando or self.fallas >= self.max_fallas:
+                self.abierto_desde = time.monotonic()
+            self._probando = False
+
+    def liberar(self) -> None:
+        """Soltar la llamada de prueba sin resultado (falló por otra causa)"""
+        with self._lock:
+            self._probando = False
+
+
+# Errores de PostgREST que equivalen a un 5xx: sin conexión a la base
+# (PGRST000-003) y clases SQLSTATE de conexión, recursos, cancelación
+# (p. ej. statement timeout) y fallas internas. Si la respuesta no trae
+# JSON, ``code`` es el status HTTP (un ``int``).
+POSTGREST_CODIGOS_FALLA = ("PGRST000", "PGRST001", "PGRST002", "PGRST003")
+SQLSTATE_CLASES_FALLA = ("08", "53", "57", "58", "XX")
+
+
+def es_falla_del_servidor(error: APIError) -> bool:
+    """Indica si un ``APIError`` es una falla del servidor (5xx) y no de la consulta"""
+    if isinstance(error.code, int):
+        return error.code >= 500
+    codigo = str(error.code or "")
+    return codigo in POSTGREST_CODIGOS_FALLA or codigo[:2] in SQLSTATE_CLASES_FALLA
+
+
+@st.cache_resource
+def get_circuit_breaker() -> CircuitBreaker:
+    """Obtener el circuito de Supabase del proceso"""
+    return CircuitBreaker(SUPABASE_CIRCUIT_FAILURES, SUPABASE_CIRCUIT_RESET_SECONDS)
+
+
+@st.cache_resource
+def get_respaldo_consultas() -> "KpiCache":
+    """Última respuesta buena de cada lectura, para usarla si Supabase falla (LRU sin vencimiento)"""
+    return KpiCache(math.inf, SUPABASE_FALLBACK_ENTRIES)
+
+
+def ejecutar(query, reintentar: bool = True, respaldo: tuple | None = None):
+    """Ejecutar una consulta de Supabase a través del circuito
+
+    Todas las llamadas pasan por aquí en lugar de ``query.execute()``:
+
+    - Con el circuito abierto no se llama a Supabase.
+    - Las lecturas (``reintentar=True``) se reintentan ante fallas de red o
+      5xx hasta ``SUPABASE_RETRIES`` veces con espera exponencial y jitter;
+      las escrituras se intentan una vez para no duplicarlas.
+    - Con ``respaldo`` (una llave) la respuesta buena se guarda y, si todo
+      falla, se devuelve la última guardada en vez de la excepción. No
+      usarlo dentro de funciones cacheadas: el respaldo quedaría guardado
+      como si fuera la respuesta actual.
+
+    Los demás errores que responde PostgREST (4xx) significan que el
+    servidor contestó: cuentan como éxito del circuito y se propagan sin
+    reintentar.
+    """
+    circuito = get_circuit_breaker()
+    intentos = SUPABASE_RETRIES if reintentar else 1
+    error: Exception | None = None
+    for intento in range(intentos):
+        if not circuito.permitir():
+            error = SupabaseNoDisponible("Supabase no responde; se reintentará en unos segundos")
+            break
+        # True: contestó, False: falla del servidor, None: otra excepción
+        resultado = None
+        try:
+            respuesta = query.execute()
+            resultado = True
+        except httpx.TransportError as e:
+            resultado, error = False, e
+        except APIError as e:
+            resultado = not es_falla_del_servidor(e)
+            if resultado:
+                raise
+            error = e
+        finally:
+            if resultado is None:
+                circuito.liberar()
+            elif resultado:
+                circuito.exito()
+            else:
+                circuito.falla()
+        if not resultado:
+            if intento + 1 < intentos:
+                time.sleep(SUPABASE_BACKOFF_SECONDS * 2 ** intento * (0.5 + random.random()))
+            continue
+        if respaldo is not None:
+            get_respaldo_consultas().put(respaldo, respuesta)
+        return respuesta
+
+    if respaldo is not None:
+        guardada = get_respaldo_consultas().get(respaldo)
+        if guardada is not None:
+            return guardada
+    raise error
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Obtener el pool de hilos de carga del proceso"""
+    return ThreadPoolExecutor(max_workers=CARGA_PARALELA_WORKERS, thread_name_prefix="carga")
+
+
+def en_paralelo(fn, *args, **kwargs) -> Future:
+    """Lanzar ``fn(*args, **kwargs)`` en el pool y devolver su ``Future``
+
+    Las vistas piden sus consultas independientes de una vez y llaman a
+    ``result()`` al dibujar, así la espera es la de la consulta más lenta y
+    no la suma. El hilo recibe el contexto de la sesión para que los caches
+    y los ``st.error`` de las funciones de carga sigan funcionando. Lo que
+    corre en el pool no debe esperar otros futuros del pool.
+    """
+    ctx = get_script_run_ctx()
+
+    def tarea():
+        hilo = threading.current_thread()
+        add_script_run_ctx(hilo, ctx)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            add_script_run_ctx(hilo, None)
+
+    return get_executor().submit(tarea)
+
+
 # ============================================================================
 # FUNCIONES DE BASE DE DATOS - TAREAS
 # ============================================================================
 
-def load_tasks_from_db() -> list:
-    """Cargar tareas desde Supabase"""
+# Columnas que usan las vistas de tareas. Se evita ``select("*")`` para no
+# traer la antigua columna JSON ``comentarios``: los hilos completos se piden
+# por tarea con ``load_comments_from_db`` y aquí solo viaja el contador.
+TASK_SELECT = "id, descripcion, fecha_objetivo, estado, autor, asignado, cliente, num_comentarios, updated_at"
+
+
+def row_to_task(row: dict) -> dict:
+    """Convertir una fila de la tabla ``tareas`` al formato interno de tarea"""
+    return {
+        "id": row["id"],
+        "descripcion": row["descripcion"],
+        "fecha_objetivo": date.fromisoformat(row["fecha_objetivo"]),
+        "estado": row["estado"],
+        "autor": row["autor"],
+        "asignado": row["asignado"],
+        "cliente": row["cliente"],
+        "num_comentarios": row.get("num_comentarios") or 0,
+        "updated_at": pd.Timestamp(row["updated_at"]) if row.get("updated_at") else None,
+    }
+
+
+def iter_por_id(tabla: str, columnas: str, desde_id: int = 0, chunk_size: int = SUPABASE_MAX_ROWS):
+    """Recorrer las filas de ``tabla`` con id > ``desde_id`` en bloques ordenados por ``id``
+
+    Paginación por llave: Supabase corta cada respuesta en
+    ``SUPABASE_MAX_ROWS`` filas, así que una sola consulta no basta para
+    tablas grandes. Los errores se propagan.
+    """
+    supabase = get_supabase_client()
+    ultimo_id = desde_id
+    while True:
+        response = ejecutar(
+            supabase.table(tabla).select(columnas)
+            .gt("id", ultimo_id).order("id").limit(chunk_size)
+        )
+        if not response.data:
+            return
+        yield response.data
+        if len(response.data) < chunk_size:
+            return
+        ultimo_id = response.data[-1]["id"]
+
+
+def load_tasks_from_db() -> list | None:
+    """Cargar tareas desde Supabase (``None`` si falla: se conserva lo cargado)"""
+    try:
+        return [row_to_task(row) for bloque in iter_por_id("tareas", TASK_SELECT) for row in bloque]
+    except Exception as e:
+        st.error(f"Error cargando tareas: {e}")
+        return None
+
+
+def load_tasks_changed_since(marca: pd.Timestamp) -> list | None:
+    """Cargar solo las tareas modificadas desde ``marca`` (``updated_at``)
+
+    Pide desde ``marca`` menos ``TASKS_SYNC_OVERLAP_SECONDS`` y con ``gte``
+    para no perder filas confirmadas tarde o con la misma marca de tiempo;
+    volver a recibir una fila ya conocida es inofensivo porque la mezcla
+    descarta las filas sin cambios. Pagina por ``(updated_at, id)``, así un
+    lote con la misma marca (p. ej. una importación) no corta la lectura.
+    """
+    desde = marca - pd.Timedelta(seconds=TASKS_SYNC_OVERLAP_SECONDS)
     try:
         supabase = get_supabase_client()
-        response = supabase.table("tareas").select("*").order("id").execute()
-        
-        tasks = []
-        for row in response.data:
-            tasks.append({
-                "id": row["id"],
-                "descripcion": row["descripcion"],
-                "fecha_objetivo": date.fromisoformat(row["fecha_objetivo"]),
-                "estado": row["estado"],
-                "autor": row["autor"],
-                "asignado": row["asignado"],
-                "cliente": row["cliente"],
-                "comentarios": json.loads(row["comentarios"]) if row["comentarios"] else []
-            })
-        return tasks
+        tareas = []
+        cursor = None
+        while True:
+            query = supabase.table("tareas").select(TASK_SELECT)
+            if cursor is None:
+                query = query.gte("updated_at", desde.isoformat())
+            else:
+                marca_fila, task_id = cursor
+                query = query.or_(f'updated_at.gt."{marca_fila}",and(updated_at.eq."{marca_fila}",id.gt.{task_id})')
+            rows = ejecutar(query.order("updated_at").order("id").limit(SUPABASE_MAX_ROWS)).data
+            tareas.extend(row_to_task(row) for row in rows)
+            if len(rows) < SUPABASE_MAX_ROWS:
+                return tareas
+            cursor = (rows[-1]["updated_at"], rows[-1]["id"])
+    except Exception as e:
+        st.error(f"Error sincronizando tareas: {e}")
+        return None
+
+
+def count_tasks_in_db() -> int | None:
+    """Contar tareas en Supabase sin descargar filas"""
+    try:
+        supabase = get_supabase_client()
+        response = ejecutar(supabase.table("tareas").select("id", count="exact").limit(1))
+        return response.count
+    except Exception as e:
+        st.error(f"Error contando tareas: {e}")
+        return None
+
+
+def load_task_ids_from_db() -> set | None:
+    """Cargar solo los ids de las tareas existentes (detección de eliminadas)"""
+    try:
+        return {row["id"] for bloque in iter_por_id("tareas", "id") for row in bloque}
+    except Exception as e:
+        st.error(f"Error cargando ids de tareas: {e}")
+        return None
+
+
+def apply_task_filters(query, filtros: dict):
+    """Traducir los filtros de la UI a filtros PostgREST sobre ``tareas``
+
+    Claves reconocidas (los valores ``None``, "" o "Todos" se ignoran):
+
+    - ``persona``: ``asignado = persona`` (usa ``idx_tareas_asignado``)
+    - ``estado``: ``estado = estado`` (usa ``idx_tareas_estado``)
+    - ``excluir_estado``: ``estado <> excluir_estado``
+    - ``desde`` / ``hasta``: rango inclusivo sobre ``fecha_objetivo``
+      (usa ``idx_tareas_fecha``)
+    - ``ids``: lista de ids (p. ej. resultados de ``buscar_tareas``)
+    """
+    def activo(clave):
+        return filtros.get(clave) not in (None, "", "Todos")
+
+    if activo("persona"):
+        query = query.eq("asignado", filtros["persona"])
+    if activo("estado"):
+        query = query.eq("estado", filtros["estado"])
+    if activo("excluir_estado"):
+        query = query.neq("estado", filtros["excluir_estado"])
+    if activo("desde"):
+        query = query.gte("fecha_objetivo", filtros["desde"].isoformat())
+    if activo("hasta"):
+        query = query.lte("fecha_objetivo", filtros["hasta"].isoformat())
+    if filtros.get("ids") is not None:
+        query = query.in_("id", list(filtros["ids"]))
+    return query
+
+
+def load_tasks_filtered(filtros: dict) -> list:
+    """Cargar desde Supabase solo las tareas que cumplen ``filtros``
+
+    Ver ``apply_task_filters`` para las claves admitidas.
+    """
+    try:
+        supabase = get_supabase_client()
+        query = apply_task_filters(supabase.table("tareas").select(TASK_SELECT), filtros)
+        response = ejecutar(
+            query.order("fecha_objetivo").order("id"),
+            respaldo=("tareas_filtradas", repr(sorted(filtros.items()))),
+        )
+        return [row_to_task(row) for row in response.data]
     except Exception as e:
         st.error(f"Error cargando tareas: {e}")
         return []
 
 
-def save_task_to_db(task: dict) -> bool:
-    """Guardar una tarea nueva en Supabase"""
+def fetch_tasks_page(
+    filtros: dict, cursor: tuple | None = None, limit: int = 20, usar_respaldo: bool = False, contar: bool = False
+) -> tuple[list, tuple | None, int | None]:
+    """Cargar una página de tareas ordenada por ``(fecha_objetivo, id)``
+
+    Usa paginación por llave: ``cursor`` es la pareja ``(fecha_objetivo, id)``
+    de la última fila de la página anterior, así que cada página cuesta lo
+    mismo sin importar cuán atrás esté. ``filtros`` se aplica con
+    ``apply_task_filters``.
+
+    Devuelve ``(tareas, siguiente_cursor, total)``; ``total`` solo se pide en
+    la primera página (``cursor=None``) o con ``contar``, y ``siguiente_cursor`` es ``None``
+    cuando no hay más filas. Los errores se propagan (una página vacía
+    parecería el final de los datos); con ``usar_respaldo`` puede devolverse
+    la última respuesta buena de la misma página.
+    """
+    supabase = get_supabase_client()
+    if cursor is None:
+        query = supabase.table("tareas").select(TASK_SELECT, count="exact")
+    else:
+        query = supabase.table("tareas").select(TASK_SELECT)
+
+    query = apply_task_filters(query, filtros)
+
+    if cursor is not None:
+        fecha, task_id = cursor
+        query = query.or_(f"fecha_objetivo.gt.{fecha},and(fecha_objetivo.eq.{fecha},id.gt.{task_id})")
+
+    response = ejecutar(
+        query.order("fecha_objetivo").order("id").limit(limit + 1),
+        respaldo=("tareas_pagina", repr(sorted(filtros.items())), cursor, limit) if usar_respaldo else None,
+    )
+    rows = response.data
+    siguiente = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        siguiente = (rows[-1]["fecha_objetivo"], rows[-1]["id"])
+    total = response.count
+    if contar and cursor is not None:
+        # El conteo de la página lleva el filtro del cursor: se cuenta aparte
+        total = ejecutar(
+            apply_task_filters(supabase.table("tareas").select("id", count="exact"), filtros).limit(1),
+            respaldo=("tareas_total", repr(sorted(filtros.items()))) if usar_respaldo else None,
+        ).count
+    return [row_to_task(row) for row in rows], siguiente, total
+
+
+def load_tasks_page(
+    filtros: dict, cursor: tuple | None = None, limit: int = 20, contar: bool = False
+) -> tuple[list, tuple | None, int | None]:
+    """Página de tareas para las vistas (ver ``fetch_tasks_page``); vacía si falla"""
+    try:
+        return fetch_tasks_page(filtros, cursor, limit, usar_respaldo=True, contar=contar)
+    except Exception as e:
+        st.error(f"Error cargando página de tareas: {e}")
+        return [], None, None
+
+
+def save_task_to_db(task: dict) -> dict | None:
+    """Guardar una tarea nueva en Supabase
+
+    Devuelve la fila insertada (con su id y marcas de tiempo) y la aplica
+    directamente al almacén compartido, sin volver a descargar la tabla.
+    """
     try:
         supabase = get_supabase_client()
         task_data = {
@@ -116,53 +561,270 @@ def save_task_to_db(task: dict) -> bool:
             "autor": task["autor"],
             "asignado": task["asignado"],
             "cliente": task["cliente"],
-            "comentarios": json.dumps(task.get("comentarios", []), ensure_ascii=False)
         }
-        supabase.table("tareas").insert(task_data).execute()
-        return True
+        response = ejecutar(
+            supabase.table("tareas").insert(task_data, returning=ReturnMethod.representation),
+            reintentar=False,
+        )
+        saved = row_to_task(response.data[0])
+        get_task_store().merge([saved], advance_mark=False)
+        return saved
     except Exception as e:
         st.error(f"Error guardando tarea: {e}")
-        return False
+        return None
+
 
+def save_tasks_batch_to_db(tasks: list, chunk_size: int = IMPORT_BATCH_SIZE) -> list:
+    """Insertar varias tareas nuevas en bloques de ``chunk_size`` filas
+
+    Cada tarea tiene las mismas llaves que en ``save_task_to_db``. Las filas
+    insertadas se aplican al almacén compartido una sola vez al final; si un
+    bloque falla se detiene y devuelve las que alcanzaron a guardarse.
+    """
+    guardadas = []
+    try:
+        supabase = get_supabase_client()
+        for inicio in range(0, len(tasks), chunk_size):
+            bloque = [
+                {
+                    "descripcion": task["descripcion"],
+                    "fecha_objetivo": task["fecha_objetivo"].isoformat(),
+                    "estado": task["estado"],
+                    "autor": task["autor"],
+                    "asignado": task["asignado"],
+                    "cliente": task["cliente"],
+                }
+                for task in tasks[inicio:inicio + chunk_size]
+            ]
+            response = ejecutar(
+                supabase.table("tareas").insert(bloque, returning=ReturnMethod.representation),
+                reintentar=False,
+            )
+            guardadas.extend(row_to_task(row) for row in response.data)
+    except Exception as e:
+        st.error(f"Error guardando tareas ({len(guardadas)} de {len(tasks)} guardadas): {e}")
+    if guardadas:
+        get_task_store().merge(guardadas, advance_mark=False)
+    return guardadas
+
+
+def valor_comparable(valor):
+    """Valor de una tarea tal como se envía a Supabase (fechas en ISO)"""
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+
+def load_task_from_db(task_id: int) -> dict | None:
+    """Cargar una tarea por id (``None`` si no existe; los errores se propagan)"""
+    supabase = get_supabase_client()
+    response = ejecutar(supabase.table("tareas").select(TASK_SELECT).eq("id", task_id))
+    return row_to_task(response.data[0]) if response.data else None
+
+
+def update_task_in_db(task_id: int, updates: dict, base: dict | None = None, avisos: list | None = None) -> dict | None:
+    """Actualizar tarea en Supabase solo si no cambió desde ``base`` (``None`` si hubo conflicto)"""
+    def avisar(tipo: str, mensaje: str) -> None:
+        if avisos is None:
+            getattr(st, tipo)(mensaje)
+        else:
+            avisos.append((tipo, mensaje))
 
-def update_task_in_db(task_id: int, updates: dict) -> bool:
-    """Actualizar tarea en Supabase"""
     try:
         supabase = get_supabase_client()
         
         if "fecha_objetivo" in updates and isinstance(updates["fecha_objetivo"], date):
-            updates["fecha_objetivo"] = updates["fecha_objetivo"].isoformat()
+            updates = {**updates, "fecha_objetivo": updates["fecha_objetivo"].isoformat()}
         
-        if "comentarios" in updates:
-            updates["comentarios"] = json.dumps(updates["comentarios"], ensure_ascii=False)
+        if base is not None:
+            updates = {
+                campo: valor for campo, valor in updates.items()
+                if valor != valor_comparable(base[campo])
+            }
+            if not updates:
+                return base
         
-        supabase.table("tareas").update(updates).eq("id", task_id).execute()
-        return True
+        for _ in range(TASK_UPDATE_RETRIES):
+            query = (
+                supabase.table("tareas")
+                .update(updates, returning=ReturnMethod.representation)
+                .eq("id", task_id)
+            )
+            if base is not None and base["updated_at"] is not None:
+                query = query.eq("updated_at", base["updated_at"].isoformat())
+            response = ejecutar(query, reintentar=False)
+            if response.data:
+                saved = row_to_task(response.data[0])
+                get_task_store().merge([saved], advance_mark=False)
+                return saved
+            
+            actual = load_task_from_db(task_id)
+            if actual is None:
+                get_task_store().merge([], {task_id})
+                avisar("error", "La tarea ya no existe")
+                return None
+            get_task_store().merge([actual], advance_mark=False)
+            if base is None:
+                return None
+            
+            # Otra edición ganó: conflicto solo si tocó los mismos campos
+            pisados = [
+                campo for campo, valor in updates.items()
+                if actual[campo] != base[campo] and valor_comparable(actual[campo]) != valor
+            ]
+            if pisados:
+                avisar(
+                    "warning",
+                    f"⚠️ Otra persona modificó {', '.join(pisados)} de esta tarea. "
+                    "Se cargó su versión; revisa antes de volver a guardar."
+                )
+                return None
+            base = actual
+            updates = {campo: valor for campo, valor in updates.items() if valor != valor_comparable(actual[campo])}
+            if not updates:
+                return actual
+        
+        avisar("error", "La tarea cambió varias veces seguidas; vuelve a intentarlo")
+        return None
     except Exception as e:
-        st.error(f"Error actualizando tarea: {e}")
-        return False
+        avisar("error", f"Error actualizando tarea: {e}")
+        return None
 
 
 def delete_task_from_db(task_id: int) -> bool:
     """Eliminar tarea de Supabase"""
     try:
         supabase = get_supabase_client()
-        supabase.table("tareas").delete().eq("id", task_id).execute()
+        ejecutar(supabase.table("tareas").delete().eq("id", task_id), reintentar=False)
+        get_task_store().merge([], {task_id})
         return True
     except Exception as e:
         st.error(f"Error eliminando tarea: {e}")
         return False
 
 
+# ============================================================================
+# FUNCIONES DE BASE DE DATOS - COMENTARIOS
+# ============================================================================
+
+@st.cache_data(max_entries=500, show_spinner=False)
+def load_comments_from_db(task_id: int, num_comentarios: int) -> list:
+    """Cargar el hilo de comentarios de una tarea, del más antiguo al más nuevo
+
+    ``num_comentarios`` solo forma parte de la llave del cache: cambia con
+    cada comentario nuevo, así que un hilo cacheado nunca queda desfasado.
+    Los errores se propagan para no cachear un hilo vacío.
+    """
+    supabase = get_supabase_client()
+    response = ejecutar(
+        supabase.table("comentarios")
+        .select("autor, texto, fecha")
+        .eq("tarea_id", task_id)
+        .order("fecha")
+    )
+    return response.data
+
+
+def save_comment_to_db(task_id: int, autor: str, texto: str) -> dict | None:
+    """Agregar un comentario a una tarea (un INSERT, sin reescribir el hilo)"""
+    try:
+        supabase = get_supabase_client()
+        response = ejecutar(supabase.table("comentarios").insert({
+            "tarea_id": task_id,
+            "autor": autor,
+            "texto": texto,
+        }), reintentar=False)
+        task = find_task(task_id)
+        if task:
+            get_task_store().merge(
+                [{**task, "num_comentarios": task["num_comentarios"] + 1}],
+                advance_mark=False,
+            )
+        return response.data[0]
+    except Exception as e:
+        st.error(f"Error guardando comentario: {e}")
+        return None
+
+
+def load_comment_texts_since(last_id: int) -> list | None:
+    """Cargar ``(id, tarea_id, texto)`` de los comentarios con id > ``last_id``
+
+    La tabla solo recibe inserciones, así que el id sirve de marca para que
+    el índice de búsqueda traiga únicamente los comentarios nuevos.
+    """
+    try:
+        return [row for bloque in iter_por_id("comentarios", "id, tarea_id, texto", last_id) for row in bloque]
+    except Exception as e:
+        st.error(f"Error cargando comentarios para búsqueda: {e}")
+        return None
+
+
 # ============================================================================
 # FUNCIONES DE BASE DE DATOS - KPIs
 # ============================================================================
 
+class KpiCache:
+    """Cache de consultas de KPIs por rango de fechas (TTL + LRU).
+
+    La llave empieza con ``(start_date, end_date)`` tal como se pasa a
+    ``load_kpis_from_db``; los agregados de ``rollup_kpis`` agregan la
+    frecuencia como tercer elemento. Las entradas vencen a los ``ttl`` segundos y, al
+    superar ``max_entries``, se descarta la usada hace más tiempo. Guardar un
+    KPI invalida solo los rangos que contienen esa semana. Con ``ttl=math.inf``
+    sirve también de respaldo de lecturas (``get_respaldo_consultas``).
+    """
+
+    def __init__(self, ttl: float, max_entries: int) -> None:
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            guardado, valor = entry
+            if time.monotonic() - guardado > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return valor
+
+    def put(self, key: tuple, valor) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), valor)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_week(self, semana: date) -> None:
+        """Descartar los rangos cacheados que incluyen ``semana``"""
+        with self._lock:
+            for key in list(self._entries):
+                start_date, end_date = key[:2]
+                if (start_date is None or start_date <= semana) and (end_date is None or semana <= end_date):
+                    del self._entries[key]
+
+
+@st.cache_resource
+def get_kpi_cache() -> KpiCache:
+    """Obtener el cache de KPIs del proceso"""
+    return KpiCache(KPI_CACHE_TTL, KPI_CACHE_MAX_ENTRIES)
+
+
 def save_kpi_to_db(kpi_data: dict) -> bool:
-    """Guardar KPI en Supabase"""
+    """Guardar KPI en Supabase (reemplaza el de la misma semana y persona)"""
+    return save_kpis_batch_to_db([kpi_data])
+
+
+def save_kpis_batch_to_db(kpis: list) -> bool:
+    """Guardar varios KPIs en un solo upsert sobre ``(semana, persona)``"""
     try:
         supabase = get_supabase_client()
-        supabase.table("kpis").insert(kpi_data).execute()
+        ejecutar(supabase.table("kpis").upsert(kpis, on_conflict="semana,persona"), reintentar=False)
+        cache = get_kpi_cache()
+        for semana in {str(k["semana"]) for k in kpis}:
+            cache.invalidate_week(date.fromisoformat(semana))
         return True
     except Exception as e:
         st.error(f"Error guardando KPI: {e}")
@@ -170,7 +832,15 @@ def save_kpi_to_db(kpi_data: dict) -> bool:
 
 
 def load_kpis_from_db(start_date: date = None, end_date: date = None) -> pd.DataFrame:
-    """Cargar KPIs desde Supabase"""
+    """Cargar KPIs desde Supabase (cacheado por rango; no modificar el resultado)
+
+    Si Supabase falla se devuelve el último resultado bueno del rango, sin
+    guardarlo en el cache y marcado con ``attrs["respaldo"]``.
+    """
+    cache = get_kpi_cache()
+    cached = cache.get((start_date, end_date))
+    if cached is not None:
+        return cached
     try:
         supabase = get_supabase_client()
         query = supabase.table("kpis").select("*")
@@ -180,18 +850,55 @@ def load_kpis_from_db(start_date: date = None, end_date: date = None) -> pd.Data
         if end_date:
             query = query.lte("semana", end_date.isoformat())
         
-        response = query.order("semana", desc=True).execute()
+        response = ejecutar(query.order("semana", desc=True))
         
         if response.data:
             df = pd.DataFrame(response.data)
             df['semana'] = pd.to_datetime(df['semana']).dt.date
-            return df
-        return pd.DataFrame()
+        else:
+            df = pd.DataFrame()
+        cache.put((start_date, end_date), df)
+        get_respaldo_consultas().put(("kpis", start_date, end_date), df)
+        return df
     except Exception as e:
+        guardado = get_respaldo_consultas().get(("kpis", start_date, end_date))
+        if guardado is not None:
+            guardado = guardado.copy(deep=False)
+            guardado.attrs["respaldo"] = True
+            return guardado
         st.error(f"Error cargando KPIs: {e}")
         return pd.DataFrame()
 
 
+@st.cache_resource(max_entries=4, show_spinner=False)
+def autonomia_semanal(_df: pd.DataFrame, version: int) -> pd.DataFrame:
+    """Autonomía de todas las personas y semanas en una sola agrupación
+
+    Índice (``asignado``, ``semana``) con la semana como el lunes (``date``)
+    y columnas ``total``, ``completadas`` y ``autonomia`` (%).
+    """
+    fechas = _df['fecha_objetivo']
+    semanas = (fechas - pd.to_timedelta(fechas.dt.weekday, unit='D')).dt.date
+    tabla = (
+        _df.assign(semana=semanas, completada=_df['estado'] == 'Completada')
+        .dropna(subset=['semana'])
+        .groupby(['asignado', 'semana'], observed=True)['completada']
+        .agg(total='size', completadas='sum')
+    )
+    tabla['autonomia'] = (tabla['completadas'] / tabla['total'] * 100).round(2)
+    return tabla
+
+
+def autonomia_por_persona(semana: date) -> dict:
+    """Autonomía de cada persona en la semana que empieza el lunes ``semana``"""
+    df = to_df()
+    if df.empty:
+        return {}
+    tabla = autonomia_semanal(df, df.attrs.get("version", 0))
+    de_semana = tabla[tabla.index.get_level_values('semana') == semana]
+    return {str(persona): float(valor) for (persona, _), valor in de_semana['autonomia'].items()}
+
+
 def calcular_autonomia(persona: str, semana_inicio: date, semana_fin: date) -> float:
     """Calcular KPI de autonomía basado en tareas"""
     try:
@@ -199,51 +906,123 @@ def calcular_autonomia(persona: str, semana_inicio: date, semana_fin: date) -> f
         if df.empty:
             return 0.0
         
-        # Filtrar tareas de la semana y persona
-        mask = (
-            (df['asignado'] == persona) &
-            (df['fecha_objetivo'] >= semana_inicio) &
-            (df['fecha_objetivo'] <= semana_fin)
-        )
-        tareas_semana = df[mask]
+        # Semanas completas (lunes a domingo): sumar desde la tabla precalculada
+        if semana_inicio.weekday() == 0 and semana_fin.weekday() == 6:
+            tabla = autonomia_semanal(df, df.attrs.get("version", 0))
+            if persona not in tabla.index.get_level_values('asignado'):
+                return 0.0
+            de_persona = tabla.xs(persona, level='asignado')
+            en_rango = de_persona[(de_persona.index >= semana_inicio) & (de_persona.index <= semana_fin)]
+            total = int(en_rango['total'].sum())
+            completadas = int(en_rango['completadas'].sum())
+        else:
+            mask = (
+                (df['asignado'] == persona) &
+                (df['fecha_objetivo'] >= pd.Timestamp(semana_inicio)) &
+                (df['fecha_objetivo'] <= pd.Timestamp(semana_fin))
+            )
+            total = int(mask.sum())
+            completadas = int((mask & (df['estado'] == 'Completada')).sum())
         
-        if len(tareas_semana) == 0:
+        if total == 0:
             return 0.0
         
-        # Calcular completadas
-        completadas = len(tareas_semana[tareas_semana['estado'] == 'Completada'])
-        total = len(tareas_semana)
-        
         return round((completadas / total) * 100, 2)
     except Exception as e:
         st.error(f"Error calculando autonomía: {e}")
         return 0.0
 
 
+def metas_por_semana(semanas: pd.Series) -> pd.DataFrame:
+    """Metas vigentes para cada semana según ``METAS_KPI_PERIODOS``
+
+    Devuelve un DataFrame alineado con ``semanas`` con una columna por
+    indicador. Las semanas nulas usan las metas actuales (``METAS_KPI``).
+    """
+    inicios = pd.to_datetime(pd.Series([inicio for inicio, _ in METAS_KPI_PERIODOS])).to_numpy()
+    fechas = pd.to_datetime(pd.Series(semanas)).to_numpy()
+    posiciones = np.searchsorted(inicios, fechas, side="right") - 1
+    posiciones = np.where(pd.isna(fechas), len(METAS_KPI_PERIODOS) - 1, np.clip(posiciones, 0, None))
+    return pd.DataFrame(
+        {campo: np.array([metas[campo] for _, metas in METAS_KPI_PERIODOS], dtype=float)[posiciones] for campo in METAS_KPI},
+        index=getattr(semanas, "index", None),
+    )
+
+
+def calcular_cumplimiento_df(kpis_df: pd.DataFrame) -> pd.Series:
+    """Calcular el cumplimiento KPI de todas las filas a la vez
+
+    Usa las mismas reglas que la versión por fila: los indicadores "mayor es
+    mejor" aportan ``valor / meta * 100`` con tope 100 y los reclamos restan
+    50 puntos por cada uno sobre la meta. Cada fila se evalúa con las metas
+    vigentes en su ``semana`` (ver ``METAS_KPI_PERIODOS``), así el histórico
+    se puede recalcular cuando cambian las metas.
+    """
+    if kpis_df.empty:
+        return pd.Series(dtype=float, index=kpis_df.index)
+
+    semanas = kpis_df['semana'] if 'semana' in kpis_df else pd.Series(pd.NaT, index=kpis_df.index)
+    metas = metas_por_semana(semanas)
+
+    puntajes = []
+    for campo in ['felicitaciones', 'orden', 'respuesta_cliente', 'autonomia']:
+        valores = kpis_df[campo].astype(float).to_numpy()
+        puntajes.append(np.minimum(valores / metas[campo].to_numpy() * 100, 100))
+
+    reclamos = kpis_df['reclamos'].astype(float).to_numpy()
+    exceso = reclamos - metas['reclamos'].to_numpy()
+    puntajes.append(np.where(exceso <= 0, 100, np.maximum(0, 100 - exceso * 50)))
+
+    return pd.Series(np.round(np.mean(puntajes, axis=0), 2), index=kpis_df.index)
+
+
 def calcular_cumplimiento_kpi(kpi_row: dict) -> float:
     """Calcular el cumplimiento general del KPI"""
-    cumplimientos = []
-    
-    # Felicitaciones (mayor es mejor, meta >2)
-    if kpi_row['felicitaciones'] >= METAS_KPI['felicitaciones']:
-        cumplimientos.append(100)
-    else:
-        cumplimientos.append((kpi_row['felicitaciones'] / METAS_KPI['felicitaciones']) * 100)
-    
-    # Reclamos (menor es mejor, meta <1)
-    if kpi_row['reclamos'] <= METAS_KPI['reclamos']:
-        cumplimientos.append(100)
-    else:
-        cumplimientos.append(max(0, 100 - (kpi_row['reclamos'] - METAS_KPI['reclamos']) * 50))
-    
-    # Orden, Respuesta Cliente, Autonomía (mayor es mejor)
-    for campo in ['orden', 'respuesta_cliente', 'autonomia']:
-        if kpi_row[campo] >= METAS_KPI[campo]:
-            cumplimientos.append(100)
-        else:
-            cumplimientos.append((kpi_row[campo] / METAS_KPI[campo]) * 100)
-    
-    return round(sum(cumplimientos) / len(cumplimientos), 2)
+    return float(calcular_cumplimiento_df(pd.DataFrame([kpi_row])).iloc[0])
+
+
+def rollup_kpis(start_date: date, end_date: date, agrupacion: str) -> pd.DataFrame:
+    """KPIs semanales agregados por persona y período calendario
+
+    ``agrupacion`` es una llave de ``KPI_ROLLUP_FRECUENCIAS``. Cada fila es
+    una persona en un período (``periodo`` = primer día del mes, trimestre,
+    etc.): felicitaciones y reclamos se suman, los porcentajes se promedian
+    y ``semanas`` cuenta las semanas registradas. El cumplimiento se
+    recalcula por semana con las metas vigentes antes de promediar. Se
+    guarda en el cache de KPIs, así que guardar una semana lo invalida.
+    """
+    cache = get_kpi_cache()
+    key = (start_date, end_date, agrupacion)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    kpis_df = load_kpis_from_db(start_date, end_date)
+    if kpis_df.empty:
+        return pd.DataFrame()
+
+    periodos = pd.to_datetime(kpis_df['semana']).dt.to_period(KPI_ROLLUP_FRECUENCIAS[agrupacion])
+    rollup = (
+        kpis_df.assign(
+            cumplimiento_kpi=calcular_cumplimiento_df(kpis_df),
+            periodo=periodos.dt.start_time,
+        )
+        .groupby(['periodo', 'persona'], as_index=False)
+        .agg(
+            semanas=('semana', 'size'),
+            felicitaciones=('felicitaciones', 'sum'),
+            reclamos=('reclamos', 'sum'),
+            orden=('orden', 'mean'),
+            autonomia=('autonomia', 'mean'),
+            respuesta_cliente=('respuesta_cliente', 'mean'),
+            cumplimiento_kpi=('cumplimiento_kpi', 'mean'),
+        )
+        .round({'orden': 2, 'autonomia': 2, 'respuesta_cliente': 2, 'cumplimiento_kpi': 2})
+    )
+    # Un respaldo (Supabase sin responder) no se cachea
+    if not kpis_df.attrs.get("respaldo"):
+        cache.put(key, rollup)
+    return rollup
 
 
 # ============================================================================
@@ -259,7 +1038,7 @@ def verificar_credenciales_db(username: str, password: str) -> dict | None:
     """Verificar credenciales contra Supabase"""
     try:
         supabase = get_supabase_client()
-        response = supabase.table("usuarios").select("*").eq("username", username).execute()
+        response = ejecutar(supabase.table("usuarios").select("*").eq("username", username))
         
         if response.data and len(response.data) > 0:
             user = response.data[0]
@@ -270,7 +1049,7 @@ def verificar_credenciales_db(username: str, password: str) -> dict | None:
                 if stored_password == password:
                     # Actualizar a hash
                     new_hash = hash_password(password)
-                    supabase.table("usuarios").update({"password_hash": new_hash}).eq("username", username).execute()
+                    ejecutar(supabase.table("usuarios").update({"password_hash": new_hash}).eq("username", username), reintentar=False)
                     return {
                         "nombre": user['nombre'],
                         "rol": user['rol']
@@ -308,10 +1087,10 @@ def cambiar_contraseña(username: str, current_password: str, new_password: str)
         
         supabase = get_supabase_client()
         new_hash = hash_password(new_password)
-        supabase.table("usuarios").update({
+        ejecutar(supabase.table("usuarios").update({
             "password_hash": new_hash,
             "updated_at": datetime.now().isoformat()
-        }).eq("username", username).execute()
+        }).eq("username", username), reintentar=False)
         
         return True, "Contraseña actualizada exitosamente"
     except Exception as e:
@@ -410,27 +1189,521 @@ def logout() -> None:
 # INICIALIZACIÓN DE DATOS
 # ============================================================================
 
+class TaskStore:
+    """Almacén de tareas compartido por todas las sesiones del proceso.
+
+    Guarda una única copia de la tabla ``tareas`` y entrega a cada sesión la
+    misma instantánea de solo lectura (una tupla ordenada por id). Cada cambio
+    publica una instantánea nueva y sube ``version``, de modo que las sesiones
+    detectan los cambios sin guardar su propia copia en ``st.session_state``.
+
+    ``high_water`` es el mayor ``updated_at`` visto; ``sync_tasks`` lo usa para
+    pedir a Supabase solo las filas modificadas desde entonces.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._by_id: dict = {}
+        self._tasks: tuple = ()
+        self.version = 0
+        self.loaded = False
+        self.last_sync = 0.0
+        self.high_water: pd.Timestamp | None = None
+        self._frame: pd.DataFrame | None = None
+        self._frame_version = -1
+
+    def snapshot(self) -> tuple:
+        """Instantánea actual de tareas (no debe modificarse)"""
+        return self._tasks
+
+    def ids(self) -> set:
+        """Ids de las tareas conocidas"""
+        return set(self._by_id)
+
+    def get(self, task_id: int) -> dict | None:
+        """Tarea con ese id en la versión actual, o ``None``"""
+        return self._by_id.get(task_id)
+
+    def replace(self, tasks: list) -> None:
+        """Reemplazar todas las tareas y publicar una nueva versión"""
+        with self._lock:
+            self._by_id = {t["id"]: t for t in tasks}
+            self.high_water = None
+            self._publish(tasks)
+            self.last_sync = time.monotonic()
+
+    def merge(self, changed: list, deleted_ids: set = frozenset(), advance_mark: bool = True) -> bool:
+        """Mezclar tareas modificadas y eliminadas en una nueva versión
+
+        Las filas idénticas a las ya conocidas se ignoran; si no queda ningún
+        cambio real no se publica versión nueva. Devuelve si hubo cambios.
+
+        Las escrituras propias usan ``advance_mark=False``: mover la marca con
+        ellas podría saltarse cambios de otros procesos con una marca anterior
+        que aún no se sincronizaron.
+        """
+        with self._lock:
+            changed = [t for t in changed if self._by_id.get(t["id"]) != t]
+            deleted_ids = {i for i in deleted_ids if i in self._by_id}
+            if not changed and not deleted_ids:
+                return False
+            by_id = dict(self._by_id)
+            for task_id in deleted_ids:
+                by_id.pop(task_id, None)
+            for task in changed:
+                by_id[task["id"]] = task
+            self._by_id = by_id
+            self._patch_frame(changed, deleted_ids)
+            self._publish(changed if advance_mark else [])
+            return True
+
+    def _publish(self, changed: list) -> None:
+        self._tasks = tuple(self._by_id[k] for k in sorted(self._by_id))
+        marcas = [t["updated_at"] for t in changed if t.get("updated_at") is not None]
+        if marcas:
+            self.high_water = max([self.high_water, *marcas] if self.high_water is not None else marcas)
+        self.version += 1
+        self.loaded = True
+
+    def frame(self) -> pd.DataFrame:
+        """DataFrame derivado de la instantánea actual (compartido, solo lectura)"""
+        frame, frame_version = self._frame, self._frame_version
+        if frame is not None and frame_version == self.version:
+            return frame
+        with self._lock:
+            if self._frame is None or self._frame_version != self.version:
+                self._frame = tasks_to_df(self._tasks)
+                # Llave de los cálculos cacheados, que reciben el frame como ``_df`` sin hashearlo
+                self._frame.attrs["version"] = self.version
+                self._frame_version = self.version
+            return self._frame
+
+    def _patch_frame(self, changed: list, deleted_ids: set) -> None:
+        # Parchea una copia del DataFrame vigente en vez de reconstruirlo desde
+        # los dicts; las sesiones que leen el anterior no ven cambios a medias.
+        if self._frame is None or self._frame_version != self.version:
+            return
+        quitar = deleted_ids | {t["id"] for t in changed}
+        frame = self._frame[~self._frame["id"].isin(quitar)]
+        if changed:
+            frame = concat_task_frames(frame, tasks_to_df(changed))
+        self._frame = frame.sort_values("id", ignore_index=True)
+        self._frame.attrs["version"] = self.version + 1
+        self._frame_version = self.version + 1
+
+    def ensure_loaded(self, loader) -> None:
+        """Cargar las tareas una sola vez aunque varias sesiones entren a la vez"""
+        if self.loaded:
+            return
+        with self._load_lock:
+            if not self.loaded:
+                tasks = loader()
+                if tasks is not None:
+                    self.replace(tasks)
+
+    def sync_if_due(self, sincronizar, intervalo: float, forzar: bool = False) -> bool:
+        """Llamar ``sincronizar()`` bajo el lock de carga si pasaron ``intervalo`` segundos"""
+        with self._load_lock:
+            if not forzar and time.monotonic() - self.last_sync <= intervalo:
+                return True
+            try:
+                return sincronizar()
+            finally:
+                self.last_sync = time.monotonic()
+
+
+@st.cache_resource
+def get_task_store() -> TaskStore:
+    """Obtener el almacén de tareas del proceso (una instancia para todas las sesiones)"""
+    return TaskStore()
+
+
+def get_tasks() -> tuple:
+    """Instantánea de solo lectura de las tareas compartidas"""
+    return get_task_store().snapshot()
+
+
+def find_task(task_id: int) -> dict | None:
+    """Buscar una tarea por id en la instantánea compartida"""
+    return get_task_store().get(task_id)
+
+
 def init_data() -> None:
-    """Inicializar datos desde Supabase"""
-    if "tasks_loaded" not in st.session_state:
-        st.session_state.tasks = load_tasks_from_db()
-        st.session_state.tasks_loaded = True
+    """Inicializar datos desde Supabase (una sola carga por proceso)
+
+    Las escrituras propias ya se aplican al almacén; para ver las de otros
+    procesos se hace una sincronización incremental cada ``TASKS_SYNC_SECONDS``.
+    """
+    store = get_task_store()
+    store.ensure_loaded(load_tasks_from_db)
+    if time.monotonic() - store.last_sync > TASKS_SYNC_SECONDS:
+        sync_tasks(store)
+
+
+def tareas_por_sincronizar() -> bool:
+    """Indica si ``init_data`` va a consultar Supabase (primera carga o sincronización)"""
+    store = get_task_store()
+    return not store.loaded or time.monotonic() - store.last_sync > TASKS_SYNC_SECONDS
+
+
+def sync_tasks(store: TaskStore | None = None, forzar: bool = False) -> bool:
+    """Sincronizar el almacén con Supabase trayendo solo los cambios.
+
+    Descarga las filas con ``updated_at`` >= la última marca conocida y las
+    mezcla. Para detectar eliminaciones compara el conteo del servidor con los
+    ids conocidos; solo si no coinciden descarga la lista de ids. Si aparecen
+    ids que el delta no trajo (p. ej. relojes desfasados) recarga todo.
+    Devuelve ``False`` si alguna consulta falló.
+    """
+    store = store or get_task_store()
+    return store.sync_if_due(lambda: sincronizar_cambios(store), TASKS_SYNC_SECONDS, forzar)
+
+
+def sincronizar_cambios(store: TaskStore) -> bool:
+    """Una pasada de ``sync_tasks`` (llamar con el lock de carga tomado)"""
+    if store.high_water is None:
+        tasks = load_tasks_from_db()
+        if tasks is None:
+            return False
+        store.replace(tasks)
+        return True
 
+    changed = load_tasks_changed_since(store.high_water)
+    if changed is None:
+        return False
 
-def refresh_tasks() -> None:
-    """Refrescar tareas desde la base de datos"""
-    st.session_state.tasks = load_tasks_from_db()
+    known = store.ids() | {t["id"] for t in changed}
+    deleted = set()
+    total = count_tasks_in_db()
+    if total is not None and total != len(known):
+        server_ids = load_task_ids_from_db()
+        if server_ids is None:
+            return False
+        if server_ids - known:
+            tasks = load_tasks_from_db()
+            if tasks is None:
+                return False
+            store.replace(tasks)
+            return True
+        deleted = known - server_ids
+
+    store.merge(changed, deleted)
+    return total is not None
+
+
+class TaskPoller:
+    """Hilo de fondo que mantiene el almacén al día para el modo en vivo.
+
+    Hay uno por proceso (``get_task_poller``). Cada ``intervalo`` segundos
+    llama a ``sincronizar(store)``, que devuelve si pudo sincronizar (si no,
+    ``ultimo_error`` lo indica); si hubo cambios, ``store.version`` sube y
+    las sesiones en vivo lo notan sin consultar Supabase. Las sesiones que
+    miran el dashboard llaman a ``touch``; sin espectadores por ``inactivo``
+    segundos el hilo termina y el siguiente ``start`` lo vuelve a crear.
+
+    ``sincronizar`` puede reemplazarse por otra fuente de cambios (p. ej. una
+    suscripción de Supabase Realtime que llame a ``store.merge``).
+    """
+
+    def __init__(self, store: TaskStore, sincronizar, intervalo: float, inactivo: float) -> None:
+        self.store = store
+        self.sincronizar = sincronizar
+        self.intervalo = intervalo
+        self.inactivo = inactivo
+        self.ultimo_error: str | None = None
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._ultimo_interes = 0.0
+
+    def touch(self) -> None:
+        """Registrar que una sesión sigue mirando"""
+        self._ultimo_interes = time.monotonic()
+
+    def start(self) -> None:
+        """Iniciar el hilo si no está corriendo"""
+        self.touch()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="task-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while time.monotonic() - self._ultimo_interes < self.inactivo:
+            time.sleep(self.intervalo)
+            try:
+                ok = self.sincronizar(self.store)
+            except Exception as e:
+                self.ultimo_error = str(e)
+            else:
+                self.ultimo_error = None if ok else "Supabase no responde"
 
 
-def to_df() -> pd.DataFrame:
-    """Convertir tareas a DataFrame"""
-    df = pd.DataFrame(st.session_state.tasks)
-    if df.empty:
-        return pd.DataFrame(columns=["id", "descripcion", "fecha_objetivo", "estado", "autor", "asignado", "cliente", "comentarios"])
-    df["fecha_objetivo"] = pd.to_datetime(df["fecha_objetivo"]).dt.date
+@st.cache_resource
+def get_task_poller() -> TaskPoller:
+    """Obtener el sincronizador de fondo del proceso"""
+    return TaskPoller(
+        get_task_store(), lambda store: sync_tasks(store, forzar=True), LIVE_POLL_SECONDS, LIVE_IDLE_SECONDS
+    )
+
+
+TASK_COLUMNS = ["id", "descripcion", "fecha_objetivo", "estado", "autor", "asignado", "cliente", "num_comentarios"]
+TASK_CATEGORY_COLUMNS = ["asignado", "cliente", "autor"]
+
+
+def tasks_to_df(tasks) -> pd.DataFrame:
+    """Construir el DataFrame columnar de tareas a partir de dicts
+
+    ``fecha_objetivo`` queda como ``datetime64[ns]`` (compárese contra
+    ``pd.Timestamp``) y ``estado``/``asignado``/``cliente``/``autor`` como
+    categóricas, para que los filtros de las vistas sean vectorizados.
+    """
+    df = pd.DataFrame(list(tasks), columns=TASK_COLUMNS)
+    df["id"] = df["id"].astype("int64")
+    df["fecha_objetivo"] = pd.to_datetime(df["fecha_objetivo"]).astype("datetime64[ns]")
+    df["estado"] = df["estado"].astype(pd.CategoricalDtype(ESTADOS))
+    for col in TASK_CATEGORY_COLUMNS:
+        df[col] = df[col].astype("category")
     return df
 
 
+def concat_task_frames(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Concatenar dos DataFrames de tareas conservando las columnas categóricas"""
+    a, b = a.copy(), b.copy()
+    for col in TASK_CATEGORY_COLUMNS:
+        cats = a[col].cat.categories.union(b[col].cat.categories)
+        a[col] = a[col].cat.set_categories(cats)
+        b[col] = b[col].cat.set_categories(cats)
+    return pd.concat([a, b], ignore_index=True)
+
+
+def to_df() -> pd.DataFrame:
+    """DataFrame de tareas (compartido; no modificar en el sitio)"""
+    return get_task_store().frame()
+
+
+# ============================================================================
+# BÚSQUEDA DE TAREAS
+# ============================================================================
+
+STOPWORDS_ES = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "o", "para", "por", "que", "se", "su", "un", "una", "y",
+}
+
+
+def normalizar_texto(texto: str) -> str:
+    """Pasar a minúsculas y quitar acentos ("Revisión" -> "revision")"""
+    descompuesto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokenizar(texto: str) -> list:
+    """Separar texto en tokens normalizados, sin palabras vacías del español"""
+    return [t for t in re.findall(r"[a-z0-9ñ]+", normalizar_texto(texto)) if t not in STOPWORDS_ES]
+
+
+class SearchIndex:
+    """Índice invertido en memoria sobre descripción, cliente y comentarios.
+
+    Se mantiene al día con el ``TaskStore`` de forma incremental: en cada
+    ``sync`` solo se reindexan las tareas cuyo dict cambió (las instantáneas
+    comparten los dicts que no cambiaron) y se quitan las eliminadas. Los
+    comentarios se indexan aparte desde la tabla ``comentarios``, trayendo
+    solo los ids posteriores al último visto.
+
+    La búsqueda exige que todos los términos aparezcan, acepta prefijos
+    ("revi" encuentra "revisión") y ordena por relevancia: peso del campo x
+    frecuencia x idf, con menos peso para coincidencias por prefijo.
+    """
+
+    CAMPOS = {"descripcion": 2.0, "cliente": 3.0, "comentarios": 1.0}
+    FACTOR_PREFIJO = 0.6
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._postings: dict = {}
+        self._vocab: list = []
+        self._docs: dict = {}
+        self._terms: dict = {}
+        self._comment_terms: dict = {}
+        self._last_comment_id = 0
+        self.version = -1
+        self.comments_version = -1
+
+    def _textos(self, task: dict) -> dict:
+        return {
+            "descripcion": task.get("descripcion", ""),
+            "cliente": task.get("cliente", ""),
+        }
+
+    def _index_terms(self, task_id: int, pesos: dict) -> None:
+        for token, peso in pesos.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                bisect.insort(self._vocab, token)
+            postings = self._postings[token]
+            postings[task_id] = postings.get(task_id, 0.0) + peso
+
+    def _unindex_terms(self, task_id: int, pesos: dict) -> None:
+        for token, peso in pesos.items():
+            postings = self._postings.get(token)
+            if postings is not None and task_id in postings:
+                postings[task_id] -= peso
+                if postings[task_id] <= 0:
+                    del postings[task_id]
+
+    def _add(self, task: dict) -> None:
+        pesos: dict = {}
+        for campo, texto in self._textos(task).items():
+            for token in tokenizar(texto):
+                pesos[token] = pesos.get(token, 0.0) + self.CAMPOS[campo]
+        self._index_terms(task["id"], pesos)
+        self._docs[task["id"]] = task
+        self._terms[task["id"]] = pesos
+
+    def _remove(self, task_id: int) -> None:
+        self._unindex_terms(task_id, self._terms.pop(task_id, {}))
+        self._docs.pop(task_id, None)
+
+    def _add_comment(self, task_id: int, texto: str) -> None:
+        pesos: dict = {}
+        for token in tokenizar(texto):
+            pesos[token] = pesos.get(token, 0.0) + self.CAMPOS["comentarios"]
+        self._index_terms(task_id, pesos)
+        acumulado = self._comment_terms.setdefault(task_id, {})
+        for token, peso in pesos.items():
+            acumulado[token] = acumulado.get(token, 0.0) + peso
+
+    def sync(self, store: TaskStore) -> None:
+        """Aplicar al índice los cambios publicados por el almacén"""
+        if self.version == store.version:
+            return
+        with self._lock:
+            version, tasks = store.version, store.snapshot()
+            if self.version == version:
+                return
+            vivos = set()
+            for task in tasks:
+                vivos.add(task["id"])
+                if self._docs.get(task["id"]) is not task:
+                    self._remove(task["id"])
+                    self._add(task)
+            for task_id in set(self._docs) - vivos:
+                self._remove(task_id)
+                self._unindex_terms(task_id, self._comment_terms.pop(task_id, {}))
+            self.version = version
+
+    def sync_comments(self, store: TaskStore) -> None:
+        """Indexar los comentarios publicados desde la última sincronización
+
+        Cada comentario nuevo cambia ``num_comentarios`` de su tarea y con eso
+        la versión del almacén; si la versión no cambió no se consulta nada.
+        """
+        if self.comments_version == store.version:
+            return
+        # La consulta va fuera del lock para no bloquear las búsquedas
+        version, desde_id = store.version, self._last_comment_id
+        nuevos = load_comment_texts_since(desde_id)
+        if nuevos is None:
+            return
+        with self._lock:
+            for com in nuevos:
+                # Otra sesión pudo aplicar los mismos comentarios entretanto
+                if com["id"] > self._last_comment_id:
+                    self._add_comment(com["tarea_id"], com["texto"])
+                    self._last_comment_id = com["id"]
+            self.comments_version = max(self.comments_version, version)
+
+    def search(self, texto: str, candidatos: set | None = None, limit: int | None = None) -> list:
+        """Ids de tareas que contienen todos los términos, de más a menos relevante"""
+        tokens = tokenizar(texto)
+        if not tokens:
+            return []
+        with self._lock:
+            total_docs = max(len(self._docs), 1)
+            scores = None
+            for token in tokens:
+                token_scores: dict = {}
+                i = bisect.bisect_left(self._vocab, token)
+                while i < len(self._vocab) and self._vocab[i].startswith(token):
+                    term = self._vocab[i]
+                    postings = self._postings.get(term)
+                    if postings:
+                        factor = 1.0 if term == token else self.FACTOR_PREFIJO
+                        idf = math.log(1 + total_docs / len(postings))
+                        for task_id, peso in postings.items():
+                            score = peso * factor * idf
+                            if score > token_scores.get(task_id, 0.0):
+                                token_scores[task_id] = score
+                    i += 1
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {t: scores[t] + sc for t, sc in token_scores.items() if t in scores}
+                if not scores:
+                    return []
+
+        if candidatos is not None:
+            scores = {t: sc for t, sc in scores.items() if t in candidatos}
+        ranked = sorted(scores, key=lambda t: (-scores[t], t))
+        return ranked[:limit] if limit else ranked
+
+
+@st.cache_resource
+def get_search_index() -> SearchIndex:
+    """Obtener el índice de búsqueda del proceso"""
+    return SearchIndex()
+
+
+def filter_task_frame(df: pd.DataFrame, filtros: dict) -> pd.DataFrame:
+    """Aplicar en pandas los filtros de ``apply_task_filters`` que no son de texto"""
+    def activo(clave):
+        return filtros.get(clave) not in (None, "", "Todos")
+
+    mask = pd.Series(True, index=df.index)
+    if activo("persona"):
+        mask &= df["asignado"] == filtros["persona"]
+    if activo("estado"):
+        mask &= df["estado"] == filtros["estado"]
+    if activo("excluir_estado"):
+        mask &= df["estado"] != filtros["excluir_estado"]
+    if activo("desde"):
+        mask &= df["fecha_objetivo"] >= pd.Timestamp(filtros["desde"])
+    if activo("hasta"):
+        mask &= df["fecha_objetivo"] <= pd.Timestamp(filtros["hasta"])
+    if filtros.get("ids") is not None:
+        mask &= df["id"].isin(filtros["ids"])
+    return df[mask]
+
+
+def buscar_tareas(texto: str, filtros: dict | None = None, limit: int = SEARCH_MAX_RESULTS) -> list:
+    """Buscar tareas en el índice local y devolver sus ids por relevancia
+
+    Si se pasan ``filtros`` (persona, estado, fechas) se aplican antes de
+    recortar a ``limit``, para que el recorte no descarte tareas que sí
+    cumplen los filtros de la vista.
+    """
+    store = get_task_store()
+    index = get_search_index()
+    index.sync(store)
+    index.sync_comments(store)
+    if not tokenizar(texto):
+        # Solo palabras vacías o símbolos: se busca el texto tal cual
+        df = filter_task_frame(store.frame(), filtros or {})
+        patron = texto.strip().lower()
+        mask = (
+            df["descripcion"].str.lower().str.contains(patron, regex=False)
+            | df["cliente"].astype(str).str.lower().str.contains(patron, regex=False)
+        )
+        return df.loc[mask, "id"].head(limit).tolist()
+    candidatos = None
+    if filtros:
+        candidatos = set(filter_task_frame(store.frame(), filtros)["id"])
+    return index.search(texto, candidatos, limit)
+
+
 # ============================================================================
 # ESTILOS CSS
 # ============================================================================
@@ -532,7 +1805,7 @@ def chip(estado: str) -> str:
     return f"<span class='chip {cls}'>{estado}</span>"
 
 
-def task_card(row: pd.Series, include_due: bool = True, risk_class: str = "") -> None:
+def task_card(row: pd.Series | dict, include_due: bool = True, risk_class: str = "") -> None:
     due_text = f" · Objetivo: {row['fecha_objetivo'].strftime('%d/%m/%Y')}" if include_due else ""
     st.markdown(
         f"""
@@ -547,15 +1820,675 @@ def task_card(row: pd.Series, include_due: bool = True, risk_class: str = "") ->
     )
 
 
+def cambiar_estado(tarea: dict, key: str) -> None:
+    """Callback del selector de estado: guarda el valor elegido en ``key``
+
+    Corre antes de volver a ejecutar el fragmento, así la tarjeta se dibuja
+    una sola vez con el estado nuevo. ``tarea`` es la versión mostrada; si
+    la escritura falla, el selector vuelve al estado actual de la tarea.
+    Los callbacks no dibujan elementos, así que los avisos (p. ej. un
+    conflicto con otra edición) quedan en ``avisos_<key>`` para la tarjeta.
+    """
+    avisos = []
+    if update_task_in_db(tarea["id"], {"estado": st.session_state[key]}, base=tarea, avisos=avisos) is None:
+        actual = find_task(tarea["id"]) or tarea
+        st.session_state[key] = actual["estado"]
+    if avisos:
+        st.session_state[f"avisos_{key}"] = avisos
+
+
+def rerun_fragmento() -> None:
+    """Volver a ejecutar solo el fragmento actual
+
+    Streamlit solo lo permite en las re-ejecuciones del fragmento; si el
+    fragmento corre como parte de la página completa, se recarga la página.
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+@st.fragment
+def tarjeta_tarea(tarea: dict, clave: str, atraso: bool = False, comentarios: bool = True) -> None:
+    """Tarjeta de una tarea con sus controles de estado, edición y comentarios
+
+    Es un fragmento: cambiar el estado, editar o comentar vuelve a ejecutar
+    solo esta tarjeta. ``tarea`` es la fila con la que se armó la lista; si
+    el almacén compartido tiene una versión igual o más reciente (las
+    escrituras propias se aplican ahí) se usa esa. ``clave`` separa los
+    widgets de la misma tarea en listas distintas. Eliminar sí recarga la
+    página, para sacar la tarea de la lista.
+    """
+    actual = find_task(tarea["id"])
+    if actual is not None and (
+        tarea.get("updated_at") is None
+        or (actual["updated_at"] is not None and actual["updated_at"] >= tarea["updated_at"])
+    ):
+        tarea = actual
+    task_id = int(tarea["id"])
+
+    if atraso:
+        days = (date.today() - tarea["fecha_objetivo"]).days
+        cls = "risk-yellow" if days <= 3 else "risk-red"
+        st.markdown(
+            f"<div class='task {cls}'><strong>{tarea['descripcion']}</strong><br>"
+            f"⏰ Días de atraso: <strong>{days}</strong> · Autor: {tarea['autor']} · Cliente: {tarea['cliente']}</div>",
+            unsafe_allow_html=True,
+        )
+    else:
+        task_card(tarea)
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+
+    with col1:
+        st.selectbox(
+            "Estado",
+            options=ESTADOS,
+            index=ESTADOS.index(tarea["estado"]),
+            key=f"status_{clave}_{task_id}",
+            on_change=cambiar_estado,
+            args=(tarea, f"status_{clave}_{task_id}"),
+        )
+
+    with col2:
+        if puede_editar_tarea(tarea):
+            if st.button("✏️ Editar", key=f"edit_btn_{clave}_{task_id}"):
+                st.session_state[f"editing_{clave}_{task_id}"] = True
+                rerun_fragmento()
+
+    with col3:
+        if puede_eliminar_tarea(tarea):
+            if st.button("🗑️ Eliminar", key=f"del_btn_{clave}_{task_id}"):
+                if st.session_state.get(f"confirm_del_{clave}_{task_id}"):
+                    if delete_task_from_db(task_id):
+                        st.session_state.pop(f"confirm_del_{clave}_{task_id}")
+                        st.success("Tarea eliminada")
+                        st.rerun()
+                else:
+                    st.session_state[f"confirm_del_{clave}_{task_id}"] = True
+                    st.warning("⚠️ Presiona de nuevo para confirmar")
+
+    # Avisos del último cambio de estado (guardados por ``cambiar_estado``)
+    for tipo, mensaje in st.session_state.pop(f"avisos_status_{clave}_{task_id}", []):
+        getattr(st, tipo)(mensaje)
+
+    # EDICIÓN
+    if st.session_state.get(f"editing_{clave}_{task_id}") and puede_editar_tarea(tarea):
+        with st.expander("✏️ Editar tarea", expanded=True):
+            new_desc = st.text_area("Descripción", value=tarea['descripcion'], key=f"desc_{clave}_{task_id}")
+            new_cliente = st.text_input("Cliente", value=tarea['cliente'], key=f"cliente_{clave}_{task_id}")
+            new_date = st.date_input("Fecha objetivo", value=tarea['fecha_objetivo'], key=f"date_{clave}_{task_id}")
+            new_asignado = st.selectbox("Asignado", JEFES_PROYECTO,
+                                        index=JEFES_PROYECTO.index(tarea['asignado']) if tarea['asignado'] in JEFES_PROYECTO else 0,
+                                        key=f"asig_{clave}_{task_id}")
+
+            col_save, col_cancel = st.columns(2)
+            with col_save:
+                if st.button("💾 Guardar cambios", key=f"save_{clave}_{task_id}"):
+                    updates = {
+                        'descripcion': new_desc,
+                        'cliente': new_cliente,
+                        'fecha_objetivo': new_date,
+                        'asignado': new_asignado
+                    }
+                    if update_task_in_db(task_id, updates, base=tarea):
+                        st.session_state.pop(f"editing_{clave}_{task_id}")
+                        st.success("Cambios guardados")
+                        rerun_fragmento()
+
+            with col_cancel:
+                if st.button("❌ Cancelar", key=f"cancel_{clave}_{task_id}"):
+                    st.session_state.pop(f"editing_{clave}_{task_id}")
+                    rerun_fragmento()
+
+    if not comentarios:
+        return
+
+    # COMENTARIOS
+    # El hilo solo se descarga cuando se activa el interruptor
+    num_comentarios = int(tarea['num_comentarios'])
+    if num_comentarios and st.toggle(f"💬 Comentarios ({num_comentarios})", key=f"show_comments_{clave}_{task_id}"):
+        try:
+            lista = load_comments_from_db(task_id, num_comentarios)
+        except Exception as e:
+            st.error(f"Error cargando comentarios: {e}")
+            lista = []
+        for com in lista:
+            com_date = pd.Timestamp(com['fecha']).strftime("%d/%m/%Y %H:%M")
+            st.caption(f"**{com['autor']}** - {com_date}")
+            st.write(com['texto'])
+            st.divider()
+
+    # Agregar comentario
+    with st.expander("➕ Agregar comentario"):
+        comment_text = st.text_area("Comentario", key=f"comment_{clave}_{task_id}")
+        if st.button("Publicar", key=f"post_comment_{clave}_{task_id}"):
+            if comment_text.strip():
+                if save_comment_to_db(task_id, st.session_state.user_info["nombre"], comment_text.strip()):
+                    st.success("Comentario agregado")
+                    rerun_fragmento()
+
+
+# ============================================================================
+# AGREGADOS DEL DASHBOARD
+# ============================================================================
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def agregados_dashboard(_df: pd.DataFrame, version: int, today: date) -> dict:
+    """Conteos del dashboard calculados una vez por versión de tareas y día
+
+    Devuelve:
+
+    - ``por_dia_persona``: tareas por fecha (filas) y persona (columnas)
+    - ``semana_estado``: tareas de lunes a viernes por estado
+    - ``atrasadas``: tareas vencidas no completadas con ``dias_atraso``,
+      de más a menos atrasada; ``atrasadas_semana`` cuenta las de esta semana
+    - ``posiciones_por_fecha``: fecha -> posiciones en ``_df`` (para tomar
+      las tareas de un día sin recorrer el DataFrame)
+    """
+    hoy = pd.Timestamp(today)
+    lunes = hoy - pd.Timedelta(days=today.weekday())
+    viernes = lunes + pd.Timedelta(days=4)
+    fechas = _df["fecha_objetivo"]
+
+    cubo = _df.groupby(["fecha_objetivo", "asignado", "estado"], observed=True).size()
+    por_dia_persona = cubo.groupby(level=[0, 1], observed=True).sum().unstack(fill_value=0)
+    por_dia_persona.columns = por_dia_persona.columns.astype(str)
+    por_dia_estado = cubo.groupby(level=[0, 2], observed=True).sum().unstack(fill_value=0)
+    por_dia_estado.columns = por_dia_estado.columns.astype(str)
+    semana_estado = (
+        por_dia_estado[(por_dia_estado.index >= lunes) & (por_dia_estado.index <= viernes)]
+        .sum()
+        .reindex(ESTADOS, fill_value=0)
+    )
+
+    atrasadas_mask = (fechas < hoy) & (_df["estado"] != "Completada")
+    atrasadas = _df[atrasadas_mask].copy()
+    atrasadas["dias_atraso"] = (hoy - atrasadas["fecha_objetivo"]).dt.days
+    atrasadas = atrasadas.sort_values("dias_atraso", ascending=False)
+    atrasadas_semana = int(atrasadas["fecha_objetivo"].between(lunes, viernes).sum())
+
+    posiciones_por_fecha = {pd.Timestamp(k): v for k, v in _df.groupby("fecha_objetivo").indices.items()}
+
+    return {
+        "por_dia_persona": por_dia_persona,
+        "semana_estado": semana_estado,
+        "atrasadas": atrasadas,
+        "atrasadas_semana": atrasadas_semana,
+        "posiciones_por_fecha": posiciones_por_fecha,
+    }
+
+
+@st.cache_data(ttl=TASKS_SYNC_SECONDS, show_spinner=False)
+def agregados_dashboard_rpc(today: date) -> dict:
+    """Mismos agregados que ``agregados_dashboard`` pedidos a Postgres
+
+    Llama a ``dashboard_conteos`` (solo lunes a viernes) y a
+    ``tareas_atrasadas``, así el dashboard recibe unas pocas filas ya
+    agregadas en lugar de la tabla ``tareas``. Se cachea ``TASKS_SYNC_SECONDS``
+    segundos, igual que la sincronización del almacén local.
+    """
+    lunes = today - timedelta(days=today.weekday())
+    viernes = lunes + timedelta(days=4)
+    supabase = get_supabase_client()
+
+    # Las dos RPC son independientes: se piden a la vez
+    pendientes_conteos = en_paralelo(
+        ejecutar, supabase.rpc("dashboard_conteos", {"desde": lunes.isoformat(), "hasta": viernes.isoformat()})
+    )
+    pendientes_atrasadas = en_paralelo(ejecutar, supabase.rpc("tareas_atrasadas", {"hoy": today.isoformat()}))
+
+    conteos = pd.DataFrame(
+        pendientes_conteos.result().data,
+        columns=["fecha_objetivo", "asignado", "estado", "total"],
+    )
+    conteos["fecha_objetivo"] = pd.to_datetime(conteos["fecha_objetivo"]).astype("datetime64[ns]")
+    por_dia_persona = conteos.pivot_table(
+        index="fecha_objetivo", columns="asignado", values="total", aggfunc="sum", fill_value=0
+    )
+    semana_estado = conteos.groupby("estado")["total"].sum().reindex(ESTADOS, fill_value=0)
+
+    atrasadas = pd.DataFrame(
+        pendientes_atrasadas.result().data,
+        columns=["id", "descripcion", "asignado", "fecha_objetivo", "dias_atraso"],
+    )
+    atrasadas["fecha_objetivo"] = pd.to_datetime(atrasadas["fecha_objetivo"]).astype("datetime64[ns]")
+    atrasadas_semana = int(atrasadas["fecha_objetivo"].between(pd.Timestamp(lunes), pd.Timestamp(viernes)).sum())
+
+    return {
+        "por_dia_persona": por_dia_persona,
+        "semana_estado": semana_estado,
+        "atrasadas": atrasadas,
+        "atrasadas_semana": atrasadas_semana,
+        "posiciones_por_fecha": None,
+    }
+
+
+@st.cache_data(ttl=TASKS_SYNC_SECONDS, show_spinner=False)
+def total_tareas_rpc() -> int:
+    """Total de tareas contado en Postgres, para el menú cuando el dashboard usa RPC"""
+    supabase = get_supabase_client()
+    return ejecutar(supabase.table("tareas").select("id", count="exact").limit(1)).count
+
+
+def tareas_del_dia(df: pd.DataFrame | None, agregados: dict, dia: date) -> pd.DataFrame:
+    """Tareas con ``fecha_objetivo`` == ``dia`` usando el índice precalculado
+
+    Sin DataFrame local (agregados de ``agregados_dashboard_rpc``) se piden
+    a Supabase solo las tareas de ese día.
+    """
+    if df is None:
+        return tasks_to_df(load_tasks_filtered({"desde": dia, "hasta": dia}))
+    posiciones = agregados["posiciones_por_fecha"].get(pd.Timestamp(dia))
+    if posiciones is None:
+        return df.iloc[0:0]
+    return df.iloc[posiciones]
+
+
+# ============================================================================
+# GRÁFICOS
+# ============================================================================
+
+# Indicadores del dashboard KPI: (campo, título, eje, mayor es mejor)
+KPI_GRAFICOS = [
+    ("felicitaciones", "Felicitaciones", "Cantidad", True),
+    ("reclamos", "Reclamos", "Cantidad", False),
+    ("orden", "Orden (%)", "%", True),
+    ("respuesta_cliente", "Respuesta Cliente (%)", "%", True),
+    ("autonomia", "Autonomía (%)", "%", True),
+    ("cumplimiento_kpi", "Cumplimiento KPI (%)", "%", True),
+]
+
+
+def kpis_formato_largo(kpis_df: pd.DataFrame) -> pd.DataFrame:
+    """Una fila por persona e indicador: ``valor``, ``meta`` y ``cumple``
+
+    La meta de cumplimiento KPI es 80%; el resto usa ``METAS_KPI``.
+    """
+    metas = {**METAS_KPI, "cumplimiento_kpi": 80}
+    campos = [campo for campo, _, _, _ in KPI_GRAFICOS]
+    largo = kpis_df[['persona'] + campos].melt(id_vars='persona', var_name='indicador', value_name='valor')
+    largo['valor'] = largo['valor'].astype(float)
+    largo['meta'] = largo['indicador'].map(metas).astype(float)
+    mayor_es_mejor = largo['indicador'].map({campo: mejor for campo, _, _, mejor in KPI_GRAFICOS})
+    largo['cumple'] = (largo['valor'] >= largo['meta']).where(mayor_es_mejor, largo['valor'] <= largo['meta'])
+    return largo
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def spec_indicadores_kpi(largo: pd.DataFrame) -> dict:
+    """Spec Vega-Lite de las barras por persona con la línea de meta
+
+    Un gráfico por indicador (dos columnas) filtrando el mismo dataset en
+    formato largo, que Vega-Lite recibe una sola vez. ``st.cache_data``
+    memoiza el spec por el hash de ``largo``.
+    """
+    base = alt.Chart(largo)
+    graficos = []
+    for campo, titulo, eje, _ in KPI_GRAFICOS:
+        escala = alt.Scale(domain=[0, 100]) if eje == "%" else alt.Undefined
+        datos = base.transform_filter(alt.datum.indicador == campo)
+        barras = datos.mark_bar().encode(
+            x=alt.X('persona:N', title=''),
+            y=alt.Y('valor:Q', title=eje, scale=escala),
+            color=alt.Color(
+                'cumple:N',
+                scale=alt.Scale(domain=[True, False], range=['#22c55e', '#ef4444']),
+                legend=None,
+            ),
+            tooltip=['persona', alt.Tooltip('valor:Q', title=titulo), 'meta'],
+        )
+        layers = [barras]
+        if campo != "cumplimiento_kpi":
+            layers.append(datos.mark_rule(color='#facc15', strokeDash=[5, 5]).encode(y='max(meta):Q'))
+        graficos.append(alt.layer(*layers).properties(title=titulo, width=260, height=220))
+    return alt.concat(*graficos, columns=2).to_dict()
+
+
+# ============================================================================
+# EXPORTACIÓN E IMPORTACIÓN
+# ============================================================================
+
+def iter_tasks_export(desde: date, hasta: date, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Recorrer las tareas del rango en bloques con ``fetch_tasks_page``
+
+    Genera ``(tareas, total)``; ``total`` es el conteo del rango (solo se pide
+    con el primer bloque y se repite en los siguientes). Si un bloque falla
+    la excepción se propaga en vez de cortar el recorrido como si terminara.
+    """
+    filtros = {"desde": desde, "hasta": hasta}
+    tareas, cursor, total = fetch_tasks_page(filtros, limit=chunk_size)
+    yield tareas, total
+    while cursor is not None:
+        tareas, cursor, _ = fetch_tasks_page(filtros, cursor, limit=chunk_size)
+        yield tareas, total
+
+
+def exportar_tareas(desde: date, hasta: date, on_progress=None) -> tuple[bytes, bytes]:
+    """Generar el CSV y el XLSX de las tareas del rango en una sola pasada
+
+    Cada bloque de Supabase se escribe en los dos archivos y se descarta, así
+    la memoria no crece con el rango: el CSV va a un archivo temporal y el
+    XLSX usa el modo ``write_only`` de openpyxl. ``on_progress(filas, total)``
+    se llama después de cada bloque. Devuelve ``(csv, xlsx)``; si falla un
+    bloque o las filas no suman el conteo del rango se lanza un error y no
+    se devuelven archivos parciales.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as csv_file, \
+            tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as xlsx_file:
+        texto = io.TextIOWrapper(csv_file, encoding="utf-8", newline="")
+        try:
+            csv_writer = csv.writer(texto)
+            csv_writer.writerow(TASK_COLUMNS)
+
+            libro = Workbook(write_only=True)
+            hoja = libro.create_sheet("KPI")
+            hoja.append(TASK_COLUMNS)
+
+            filas = 0
+            for tareas, total in iter_tasks_export(desde, hasta):
+                for tarea in tareas:
+                    fila = [tarea[columna] for columna in TASK_COLUMNS]
+                    csv_writer.writerow(fila)
+                    hoja.append(fila)
+                filas += len(tareas)
+                if on_progress:
+                    on_progress(filas, total)
+            if total is not None and filas != total:
+                raise RuntimeError(f"se leyeron {filas} de {total} tareas")
+            texto.flush()
+        finally:
+            # Soltar el archivo para que no se cierre dos veces
+            texto.detach()
+        libro.save(xlsx_file)
+
+        csv_file.seek(0)
+        xlsx_file.seek(0)
+        return csv_file.read(), xlsx_file.read()
+
+
+# Snapshots Parquet: columnas y tipos Arrow de cada tabla
+SNAPSHOT_SCHEMAS = {
+    "tareas": pa.schema([
+        ("id", pa.int64()),
+        ("descripcion", pa.string()),
+        ("fecha_objetivo", pa.date32()),
+        ("estado", pa.dictionary(pa.int32(), pa.string())),
+        ("autor", pa.dictionary(pa.int32(), pa.string())),
+        ("asignado", pa.dictionary(pa.int32(), pa.string())),
+        ("cliente", pa.dictionary(pa.int32(), pa.string())),
+        ("num_comentarios", pa.int32()),
+        ("updated_at", pa.timestamp("us", tz="UTC")),
+    ]),
+    "kpis": pa.schema([
+        ("id", pa.int64()),
+        ("semana", pa.date32()),
+        ("persona", pa.dictionary(pa.int32(), pa.string())),
+        ("felicitaciones", pa.float64()),
+        ("reclamos", pa.int32()),
+        ("orden", pa.float64()),
+        ("respuesta_cliente", pa.float64()),
+        ("autonomia", pa.float64()),
+        ("cumplimiento_kpi", pa.float64()),
+    ]),
+}
+
+
+def iter_tabla(tabla: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Recorrer una tabla completa en bloques ordenados por ``id``"""
+    return iter_por_id(tabla, ", ".join(SNAPSHOT_SCHEMAS[tabla].names), chunk_size=chunk_size)
+
+
+def snapshot_row(tabla: str, row: dict) -> dict:
+    """Fila de Supabase con los tipos de ``SNAPSHOT_SCHEMAS[tabla]``"""
+    if tabla == "tareas":
+        return row_to_task(row)
+    return {
+        "id": row["id"],
+        "semana": date.fromisoformat(str(row["semana"])[:10]),
+        "persona": row["persona"],
+        "felicitaciones": float(row["felicitaciones"]),
+        "reclamos": int(row["reclamos"]),
+        "orden": float(row["orden"]),
+        "respuesta_cliente": float(row["respuesta_cliente"]),
+        "autonomia": float(row["autonomia"]),
+        "cumplimiento_kpi": float(row["cumplimiento_kpi"]),
+    }
+
+
+def exportar_snapshot(tabla: str) -> bytes | None:
+    """Snapshot Parquet de ``tareas`` o ``kpis`` escrito bloque a bloque
+
+    Las fechas quedan como ``date32``, ``updated_at`` como timestamp UTC y las
+    columnas repetitivas (estado, personas, cliente) como diccionarios, que
+    pandas lee como ``category``.
+    """
+    schema = SNAPSHOT_SCHEMAS[tabla]
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as archivo:
+            with pq.ParquetWriter(archivo, schema, compression="zstd") as writer:
+                for filas in iter_tabla(tabla):
+                    writer.write_table(pa.Table.from_pylist([snapshot_row(tabla, row) for row in filas], schema=schema))
+            archivo.seek(0)
+            return archivo.read()
+    except Exception as e:
+        st.error(f"Error exportando {tabla}: {e}")
+        return None
+
+
+def importar_snapshot(tabla: str, archivo, autor: str = "") -> int:
+    """Cargar un snapshot Parquet de ``exportar_snapshot`` en Supabase
+
+    Se lee por lotes. Las tareas se insertan como filas nuevas (ids y
+    comentarios no se restauran) y los KPIs se reemplazan por
+    ``(semana, persona)``. Las tareas pasan por ``validar_planilla_tareas``
+    (``autor`` completa las celdas vacías) y los KPIs por
+    ``validar_snapshot_kpis``; las filas con errores se omiten y se listan.
+    Devuelve cuántas filas se guardaron.
+    """
+    try:
+        parquet = pq.ParquetFile(archivo)
+    except Exception as e:
+        st.error(f"El archivo no es un Parquet válido: {e}")
+        return 0
+    requeridas = [nombre for nombre in SNAPSHOT_SCHEMAS[tabla].names if nombre not in ("id", "num_comentarios", "updated_at")]
+    faltantes = [nombre for nombre in requeridas if nombre not in parquet.schema_arrow.names]
+    if faltantes:
+        st.error(f"Faltan columnas en el snapshot de {tabla}: {', '.join(faltantes)}")
+        return 0
+
+    guardadas = 0
+    errores = []
+    leidas = 0
+    for lote in parquet.iter_batches(batch_size=IMPORT_BATCH_SIZE, columns=requeridas):
+        filas = lote.to_pylist()
+        if tabla == "tareas":
+            # Índice continuo para que ``fila`` sea la del snapshot (1 = primera)
+            df = pd.DataFrame(filas, index=pd.RangeIndex(leidas - 1, leidas - 1 + len(filas)))
+            leidas += len(filas)
+            filas, errores_lote = validar_planilla_tareas(df, autor)
+            errores.append(errores_lote)
+            if not filas:
+                continue
+            insertadas = save_tasks_batch_to_db(filas)
+            guardadas += len(insertadas)
+            if len(insertadas) < len(filas):
+                break
+        else:
+            df = pd.DataFrame(filas, columns=requeridas, index=pd.RangeIndex(leidas, leidas + len(filas)))
+            leidas += len(filas)
+            filas, errores_lote = validar_snapshot_kpis(df)
+            errores.append(errores_lote)
+            if not filas:
+                continue
+            if not save_kpis_batch_to_db(filas):
+                break
+            guardadas += len(filas)
+
+    errores = pd.concat(errores, ignore_index=True) if errores else pd.DataFrame()
+    if not errores.empty:
+        st.warning(f"⚠️ {len(errores)} fila(s) del snapshot con errores no se importaron")
+        st.dataframe(errores, hide_index=True, use_container_width=True)
+    return guardadas
+
+
+def validar_snapshot_kpis(df: pd.DataFrame) -> tuple[list, pd.DataFrame]:
+    """Validar filas de KPIs de un snapshot con las reglas de ``ingresar_kpis``
+
+    ``persona`` debe estar en ``JEFES_PROYECTO`` y ``semana`` ser un lunes.
+    Devuelve ``(kpis, errores)``: las filas listas para
+    ``save_kpis_batch_to_db`` y un DataFrame con la fila del snapshot
+    (1 = primera) y los problemas encontrados.
+    """
+    semanas = pd.to_datetime(df["semana"], errors="coerce")
+    problemas = pd.DataFrame({
+        "Persona desconocida": ~df["persona"].isin(JEFES_PROYECTO),
+        "Semana inválida": semanas.isna(),
+        "Semana no es lunes": semanas.notna() & (semanas.dt.weekday != 0),
+    })
+    con_error = problemas.any(axis=1)
+    mensajes = pd.Series("", index=df.index)
+    for problema, mask in problemas.items():
+        mensajes = mensajes + np.where(mask, problema + ", ", "")
+    errores = pd.DataFrame({
+        "fila": df.index[con_error] + 1,
+        "errores": mensajes[con_error].str.rstrip(", ").to_numpy(),
+    })
+
+    kpis = df[~con_error].assign(semana=semanas[~con_error].dt.date.map(date.isoformat)).to_dict("records")
+    return kpis, errores
+
+
+# Columnas de una planilla de tareas; ``autor`` es opcional
+IMPORT_COLUMNAS = ["descripcion", "fecha_objetivo", "estado", "asignado", "cliente"]
+
+
+def leer_planilla_tareas(archivo) -> pd.DataFrame:
+    """Leer un CSV o XLSX de tareas como texto, con columnas normalizadas"""
+    if archivo.name.lower().endswith(".xlsx"):
+        df = pd.read_excel(archivo, dtype=object)
+    else:
+        df = pd.read_csv(archivo, dtype=str, keep_default_na=False, sep=None, engine="python")
+    df.columns = [normalizar_texto(str(columna).strip()).replace(" ", "_") for columna in df.columns]
+    return df
+
+
+def validar_planilla_tareas(df: pd.DataFrame, autor: str) -> tuple[list, pd.DataFrame]:
+    """Validar todas las filas de una planilla de tareas a la vez
+
+    Revisa columnas obligatorias, fechas, estados (``ESTADOS``) y asignados
+    (``JEFES_PROYECTO``). ``autor`` se usa cuando la planilla no trae esa
+    columna o la celda está vacía. Devuelve ``(tareas, errores)``: las
+    tareas listas para ``save_tasks_batch_to_db`` y un DataFrame con la fila
+    de la planilla (contando el encabezado) y los problemas encontrados.
+    """
+    faltantes = [columna for columna in IMPORT_COLUMNAS if columna not in df.columns]
+    if faltantes:
+        return [], pd.DataFrame({"fila": [1], "errores": [f"Faltan columnas: {', '.join(faltantes)}"]})
+
+    texto = {columna: df[columna].fillna("").astype(str).str.strip() for columna in IMPORT_COLUMNAS}
+    # ISO (AAAA-MM-DD o celdas de fecha de Excel) y, si no, DD/MM/AAAA
+    fechas = pd.to_datetime(df["fecha_objetivo"], errors="coerce", format="ISO8601").fillna(
+        pd.to_datetime(df["fecha_objetivo"], errors="coerce", dayfirst=True, format="mixed")
+    )
+    # Mismas mayúsculas que en ESTADOS y JEFES_PROYECTO
+    estados = texto["estado"].str.lower().map({e.lower(): e for e in ESTADOS})
+    asignados = texto["asignado"].str.lower().map({p.lower(): p for p in JEFES_PROYECTO})
+    autores = df["autor"].fillna("").astype(str).str.strip() if "autor" in df.columns else pd.Series("", index=df.index)
+
+    problemas = pd.DataFrame({
+        "Descripción vacía": texto["descripcion"] == "",
+        "Cliente vacío": texto["cliente"] == "",
+        "Fecha inválida": fechas.isna(),
+        "Estado desconocido": estados.isna(),
+        "Asignado desconocido": asignados.isna(),
+    })
+    con_error = problemas.any(axis=1)
+    mensajes = pd.Series("", index=df.index)
+    for problema, mask in problemas.items():
+        mensajes = mensajes + np.where(mask, problema + ", ", "")
+    errores = pd.DataFrame({
+        "fila": df.index[con_error] + 2,
+        "errores": mensajes[con_error].str.rstrip(", ").to_numpy(),
+    })
+
+    validas = ~con_error
+    tareas = pd.DataFrame({
+        "descripcion": texto["descripcion"][validas],
+        "fecha_objetivo": fechas[validas].dt.date,
+        "estado": estados[validas],
+        "autor": autores[validas].where(autores[validas] != "", autor),
+        "asignado": asignados[validas],
+        "cliente": texto["cliente"][validas],
+    }).to_dict("records")
+    return tareas, errores
+
+
+def importar_tareas_ui(key: str) -> None:
+    """Carga masiva de tareas desde una planilla (CSV o XLSX)"""
+    with st.expander("📥 Importar tareas desde CSV/XLSX"):
+        st.caption(f"Columnas: {', '.join(IMPORT_COLUMNAS)} (autor es opcional)")
+        archivo = st.file_uploader("Planilla", type=["csv", "xlsx"], key=f"{key}_archivo")
+        if archivo is None:
+            return
+        try:
+            planilla = leer_planilla_tareas(archivo)
+        except Exception as e:
+            st.error(f"No se pudo leer la planilla: {e}")
+            return
+
+        tareas, errores = validar_planilla_tareas(planilla, st.session_state.user_info["nombre"])
+        if not errores.empty:
+            st.warning(f"⚠️ {len(errores)} fila(s) con errores no se importarán")
+            st.dataframe(errores, hide_index=True, use_container_width=True)
+        if not tareas:
+            return
+
+        # Evitar importar dos veces la misma planilla: se guarda cuántas
+        # tareas alcanzaron a importarse para retomar desde ahí si un bloque falló
+        archivo_id = getattr(archivo, "file_id", archivo.name)
+        importado_id, hechas = st.session_state.get(f"{key}_importado", (None, 0))
+        if importado_id != archivo_id:
+            hechas = 0
+        if hechas >= len(tareas):
+            st.info("Esta planilla ya fue importada.")
+            return
+        if hechas:
+            st.caption(f"{hechas} de {len(tareas)} tarea(s) ya importadas; se importarán las restantes.")
+        pendientes = tareas[hechas:]
+
+        if st.button(f"💾 Importar {len(pendientes)} tarea(s)", key=f"{key}_importar"):
+            with st.spinner("Importando tareas..."):
+                guardadas = save_tasks_batch_to_db(pendientes)
+            if guardadas:
+                st.session_state[f"{key}_importado"] = (archivo_id, hechas + len(guardadas))
+                st.success(f"✓ {len(guardadas)} tarea(s) importadas")
+
+
 # ============================================================================
 # DASHBOARD GERENCIA
 # ============================================================================
 
-def dashboard_gerencia(df: pd.DataFrame) -> None:
+def dashboard_gerencia(df: pd.DataFrame | None) -> None:
+    """Dashboard semanal; con ``df=None`` usa los agregados de Postgres (RPC)"""
     today = date.today()
     monday = today - timedelta(days=today.weekday())
-    friday = monday + timedelta(days=4)
-    week_df = df[(df["fecha_objetivo"] >= monday) & (df["fecha_objetivo"] <= friday)]
+    version = df.attrs.get("version", -1) if df is not None else get_task_store().version
+    if df is None:
+        # El respaldo se guarda fuera de ``agregados_dashboard_rpc`` para no
+        # cachear datos viejos como si fueran los actuales
+        try:
+            agregados = agregados_dashboard_rpc(today)
+            get_respaldo_consultas().put(("agregados_dashboard", today), agregados)
+        except Exception as e:
+            agregados = get_respaldo_consultas().get(("agregados_dashboard", today))
+            if agregados is None:
+                st.error(f"Error cargando agregados del dashboard: {e}")
+                return
+    else:
+        agregados = agregados_dashboard(df, df.attrs.get("version", -1), today)
+    semana_estado = agregados["semana_estado"]
 
     dias = {
         "Monday": "Lunes",
@@ -581,25 +2514,31 @@ def dashboard_gerencia(df: pd.DataFrame) -> None:
         unsafe_allow_html=True,
     )
 
+    # MODO EN VIVO
+    if st.toggle("🔴 En vivo", key="dashboard_en_vivo", help="Actualiza el dashboard cuando otras personas cambian tareas"):
+        get_task_poller().start()
+        vigilar_cambios(version, rpc=df is None)
+
     # ALERTAS Y NOTIFICACIONES
-    overdue_count = len(df[(df["fecha_objetivo"] < today) & (df["estado"] != "Completada")])
+    overdue_df = agregados["atrasadas"]
+    overdue_count = len(overdue_df)
     if overdue_count > 0:
         st.error(f"⚠️ {overdue_count} tarea(s) atrasada(s) requieren atención inmediata")
     
     # MÉTRICAS VISUALES
-    done = int((week_df["estado"] == "Completada").sum())
-    progress = int((week_df["estado"] == "En Proceso").sum())
-    pending = int((week_df["estado"] == "Pendiente").sum())
+    done = int(semana_estado["Completada"])
+    progress = int(semana_estado["En Proceso"])
+    pending = int(semana_estado["Pendiente"])
     
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Completadas", done)
     col2.metric("En Proceso", progress)
     col3.metric("Pendientes", pending)
-    col4.metric("Total Semana", len(week_df))
+    col4.metric("Total Semana", int(semana_estado.sum()))
 
     # TAREAS DE HOY
     st.markdown("<div class='section'><h3>Tareas de hoy</h3></div>", unsafe_allow_html=True)
-    today_df = df[df["fecha_objetivo"] == today]
+    today_df = tareas_del_dia(df, agregados, today)
 
     cols = st.columns(3)
     for i, person in enumerate(JEFES_PROYECTO):
@@ -624,24 +2563,15 @@ def dashboard_gerencia(df: pd.DataFrame) -> None:
 
     # SALUD DE LA SEMANA
     st.markdown("<div class='section'><h3>Salud de la semana</h3></div>", unsafe_allow_html=True)
-    selected_day = st.select_slider(
-        "Selecciona día de la semana para recalcular carga",
-        options=[monday + timedelta(days=i) for i in range(5)],
-        value=today if monday <= today <= friday else monday,
-        format_func=lambda d: d.strftime("%A %d/%m"),
-    )
-    day_df = df[df["fecha_objetivo"] == selected_day]
-    workload = day_df.groupby("asignado").size().reindex(JEFES_PROYECTO, fill_value=0)
     c1, c2 = st.columns([1.2, 1])
     with c1:
-        st.subheader("Carga por persona")
-        st.bar_chart(workload)
+        carga_por_persona(agregados["por_dia_persona"], monday, today)
     with c2:
         st.subheader("Estado del equipo")
 
-        done_week = int((week_df["estado"] == "Completada").sum())
-        progress_week = int((week_df["estado"] == "En Proceso").sum())
-        overdue_week = int(((week_df["fecha_objetivo"] < today) & (week_df["estado"] != "Completada")).sum())
+        done_week = done
+        progress_week = progress
+        overdue_week = agregados["atrasadas_semana"]
         status_df = pd.DataFrame(
             {
                 "Estado": ["Verde: Completadas", "Amarillo: En Proceso", "Rojo: Atrasadas"],
@@ -666,12 +2596,10 @@ def dashboard_gerencia(df: pd.DataFrame) -> None:
 
     # RIESGOS / ATRASOS
     st.markdown("<div class='section'><h3>Riesgos / atrasos</h3></div>", unsafe_allow_html=True)
-    overdue_df = df[(df["fecha_objetivo"] < today) & (df["estado"] != "Completada")].copy()
     if overdue_df.empty:
         st.info("✓ Sin atrasos detectados. Buen ritmo del equipo.")
     else:
-        overdue_df["dias_atraso"] = overdue_df["fecha_objetivo"].apply(lambda d: (today - d).days)
-        for _, row in overdue_df.sort_values("dias_atraso", ascending=False).iterrows():
+        for _, row in overdue_df.iterrows():
             risk_class = "risk-yellow" if 1 <= row["dias_atraso"] <= 3 else "risk-red"
             st.markdown(
                 f"<div class='task {risk_class}'><strong>{row['descripcion']}</strong><br>"
@@ -680,15 +2608,67 @@ def dashboard_gerencia(df: pd.DataFrame) -> None:
             )
 
     # AUDITORÍA
+    auditoria_por_fecha(df, agregados, today)
+
+    # EXPORTAR KPI
+    exportar_kpi(monday, today)
+
+
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def vigilar_cambios(version: int, rpc: bool) -> None:
+    """Recargar la página solo cuando el almacén tiene una versión nueva
+
+    Corre cada ``LIVE_CHECK_SECONDS`` comparando ``version`` (con la que se
+    dibujó el dashboard) contra la del almacén, que actualiza el
+    ``TaskPoller``; mientras no cambie no se vuelve a dibujar nada más.
+    """
+    poller = get_task_poller()
+    poller.touch()
+    store = get_task_store()
+    if store.version != version:
+        if rpc:
+            agregados_dashboard_rpc.clear()
+            total_tareas_rpc.clear()
+        st.rerun()
+    if poller.ultimo_error:
+        st.caption(f"⚠️ En vivo sin conexión: {poller.ultimo_error}")
+    else:
+        st.caption(f"Sincronizado hace {int(time.monotonic() - store.last_sync)} s")
+
+
+@st.fragment
+def carga_por_persona(por_dia_persona: pd.DataFrame, monday: date, today: date) -> None:
+    """Selector de día y gráfico de carga (fragmento: el slider solo redibuja esto)"""
+    friday = monday + timedelta(days=4)
+    selected_day = st.select_slider(
+        "Selecciona día de la semana para recalcular carga",
+        options=[monday + timedelta(days=i) for i in range(5)],
+        value=today if monday <= today <= friday else monday,
+        format_func=lambda d: d.strftime("%A %d/%m"),
+    )
+    if pd.Timestamp(selected_day) in por_dia_persona.index:
+        workload = por_dia_persona.loc[pd.Timestamp(selected_day)].reindex(JEFES_PROYECTO, fill_value=0).rename(None)
+    else:
+        workload = pd.Series(0, index=JEFES_PROYECTO)
+    st.subheader("Carga por persona")
+    st.bar_chart(workload)
+
+
+@st.fragment
+def auditoria_por_fecha(df: pd.DataFrame | None, agregados: dict, today: date) -> None:
+    """Tareas de un día elegido (fragmento: cambiar la fecha solo redibuja esto)"""
     st.markdown("<div class='section'><h3>Auditoría por fecha</h3></div>", unsafe_allow_html=True)
     audit_day = st.date_input("Selecciona un día para auditar", value=today, key="audit_day")
-    audit_df = df[df["fecha_objetivo"] == audit_day]
+    audit_df = tareas_del_dia(df, agregados, audit_day)
     if audit_df.empty:
         st.caption("No hay tareas en la fecha seleccionada.")
     else:
         st.dataframe(audit_df[["descripcion", "estado", "autor", "asignado", "cliente"]], hide_index=True, use_container_width=True)
 
-    # EXPORTAR KPI
+
+@st.fragment
+def exportar_kpi(monday: date, today: date) -> None:
+    """Rango y descargas de la exportación (fragmento)"""
     st.markdown("<div class='section'><h3>Exportar KPI</h3></div>", unsafe_allow_html=True)
     col_i, col_f = st.columns(2)
     with col_i:
@@ -697,19 +2677,36 @@ def dashboard_gerencia(df: pd.DataFrame) -> None:
         end = st.date_input("Hasta", value=today, key="export_end")
 
     if start <= end:
-        export_df = df[(df["fecha_objetivo"] >= start) & (df["fecha_objetivo"] <= end)]
-        csv_data = export_df.to_csv(index=False).encode("utf-8")
-        st.download_button("📥 Descargar CSV", data=csv_data, file_name="kpi_tareas.csv", mime="text/csv")
-
-        xlsx_buffer = BytesIO()
-        with pd.ExcelWriter(xlsx_buffer, engine="openpyxl") as writer:
-            export_df.to_excel(writer, index=False, sheet_name="KPI")
-        st.download_button(
-            "📥 Descargar XLSX",
-            data=xlsx_buffer.getvalue(),
-            file_name="kpi_tareas.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
+        # Los archivos se generan solo al pedirlos y quedan en la sesión
+        # mientras no cambie el rango
+        archivos = st.session_state.get("export_archivos")
+        if archivos is not None and archivos["rango"] != (start, end):
+            archivos = None
+        if archivos is None:
+            if st.button("⚙️ Generar archivos", key="export_generar"):
+                progreso = st.progress(0.0, text="Exportando tareas...")
+
+                def avanzar(filas: int, total: int | None) -> None:
+                    if total:
+                        progreso.progress(min(filas / total, 1.0), text=f"Exportando tareas... {filas}/{total}")
+
+                try:
+                    csv_data, xlsx_data = exportar_tareas(start, end, on_progress=avanzar)
+                except Exception as e:
+                    st.error(f"Error exportando tareas, no se generaron archivos: {e}")
+                else:
+                    archivos = {"rango": (start, end), "csv": csv_data, "xlsx": xlsx_data}
+                    st.session_state.export_archivos = archivos
+                finally:
+                    progreso.empty()
+        if archivos is not None:
+            st.download_button("📥 Descargar CSV", data=archivos["csv"], file_name="kpi_tareas.csv", mime="text/csv")
+            st.download_button(
+                "📥 Descargar XLSX",
+                data=archivos["xlsx"],
+                file_name="kpi_tareas.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
     else:
         st.warning("El rango de fechas no es válido.")
 
@@ -718,7 +2715,7 @@ def dashboard_gerencia(df: pd.DataFrame) -> None:
 # GESTIÓN DE TAREAS (GERENTES)
 # ============================================================================
 
-def gestion_tareas_gerentes(df: pd.DataFrame) -> None:
+def gestion_tareas_gerentes() -> None:
     """Vista de gestión de tareas para gerentes"""
     st.markdown(
         """
@@ -752,16 +2749,41 @@ def gestion_tareas_gerentes(df: pd.DataFrame) -> None:
                         "autor": st.session_state.user_info["nombre"],
                         "asignado": asignado,
                         "cliente": cliente.strip(),
-                        "comentarios": []
                     }
                     
                     if save_task_to_db(nueva_tarea):
                         st.success("✓ Tarea creada exitosamente")
-                        refresh_tasks()
                         st.rerun()
                 else:
                     st.error("❌ Descripción y cliente son obligatorios")
     
+    importar_tareas_ui("gest_import")
+    
+    # RESPALDO PARQUET
+    with st.expander("🗄️ Snapshots Parquet (respaldo y carga masiva)"):
+        col_tabla, col_accion = st.columns(2)
+        with col_tabla:
+            tabla = st.selectbox("Tabla", list(SNAPSHOT_SCHEMAS), key="snapshot_tabla")
+        with col_accion:
+            if st.button("⚙️ Generar snapshot", key="snapshot_generar"):
+                with st.spinner(f"Exportando {tabla}..."):
+                    st.session_state.snapshot_archivo = (tabla, exportar_snapshot(tabla))
+        generado = st.session_state.get("snapshot_archivo")
+        if generado and generado[0] == tabla and generado[1] is not None:
+            st.download_button(
+                f"📥 Descargar {tabla}.parquet",
+                data=generado[1],
+                file_name=f"{tabla}_{date.today().isoformat()}.parquet",
+                mime="application/vnd.apache.parquet",
+            )
+
+        subido = st.file_uploader(f"Cargar snapshot de {tabla}", type=["parquet"], key="snapshot_subido")
+        if subido is not None and st.button(f"📤 Importar en {tabla}", key="snapshot_importar"):
+            with st.spinner(f"Importando {tabla}..."):
+                guardadas = importar_snapshot(tabla, subido, st.session_state.user_info["nombre"])
+            if guardadas:
+                st.success(f"✓ {guardadas} fila(s) importadas en {tabla}")
+    
     # FILTROS
     st.subheader("🔍 Filtrar tareas")
     col1, col2, col3 = st.columns(3)
@@ -770,102 +2792,70 @@ def gestion_tareas_gerentes(df: pd.DataFrame) -> None:
     with col2:
         filtro_estado = st.selectbox("Estado", ["Todos", "Pendiente", "En Proceso", "Completada"])
     with col3:
-        search = st.text_input("Buscar", placeholder="Cliente o descripción")
+        search = st.text_input("Buscar", placeholder="Cliente, descripción o comentarios")
     
-    # APLICAR FILTROS
-    filtered_df = df.copy()
-    
-    if filtro_persona != "Todos":
-        filtered_df = filtered_df[filtered_df["asignado"] == filtro_persona]
-    
-    if filtro_estado != "Todos":
-        filtered_df = filtered_df[filtered_df["estado"] == filtro_estado]
-    
-    if search:
-        mask = (
-            filtered_df['descripcion'].str.contains(search, case=False, na=False) |
-            filtered_df['cliente'].str.contains(search, case=False, na=False)
-        )
-        filtered_df = filtered_df[mask]
+    # PAGINACIÓN (por llave sobre fecha_objetivo, id)
+    filtros = {"persona": filtro_persona, "estado": filtro_estado}
+    if st.session_state.get("gest_filtros") != {**filtros, "search": search}:
+        st.session_state.gest_filtros = {**filtros, "search": search}
+        st.session_state.gest_cursores = [None]
+        st.session_state.gest_total = None
+
+    if search.strip():
+        filtros["ids"] = buscar_tareas(search, filtros)
+        if len(filtros["ids"]) == SEARCH_MAX_RESULTS:
+            st.caption(f"Mostrando los {SEARCH_MAX_RESULTS} resultados más relevantes")
+
+    cursores = st.session_state.gest_cursores
+    cursor = cursores[-1]
+    # El total se vuelve a contar si el almacén cambió (altas, bajas, ediciones)
+    version = get_task_store().version
+    contar = st.session_state.get("gest_total_version") != version
+    if filtros.get("ids") == []:
+        tareas, siguiente, total = [], None, 0
+    else:
+        tareas, siguiente, total = load_tasks_page(filtros, cursor, TASKS_PAGE_SIZE, contar=contar)
+    if total is not None:
+        st.session_state.gest_total = total
+        st.session_state.gest_total_version = version
+    total = st.session_state.gest_total
     
     # MOSTRAR TAREAS
-    st.subheader(f"📋 Tareas ({len(filtered_df)})")
+    st.subheader(f"📋 Tareas ({total if total is not None else len(tareas)})")
     
-    if filtered_df.empty:
+    if not tareas:
         st.info("No hay tareas que coincidan con los filtros")
+        # La página quedó vacía (p. ej. se eliminaron sus tareas)
+        if len(cursores) > 1 and st.button("◀ Anterior", key="gest_prev"):
+            cursores.pop()
+            st.rerun()
     else:
-        for _, row in filtered_df.sort_values("fecha_objetivo").iterrows():
-            task_card(row)
-            
-            col1, col2, col3 = st.columns([2, 1, 1])
-            
-            with col1:
-                new_status = st.selectbox(
-                    "Estado",
-                    options=ESTADOS,
-                    index=ESTADOS.index(row["estado"]),
-                    key=f"status_gest_{row['id']}",
-                )
-                if new_status != row["estado"]:
-                    if update_task_in_db(int(row["id"]), {"estado": new_status}):
-                        st.success("Estado actualizado")
-                        refresh_tasks()
-                        st.rerun()
-            
-            with col2:
-                if st.button("✏️ Editar", key=f"edit_btn_gest_{row['id']}"):
-                    st.session_state[f"editing_gest_{row['id']}"] = True
-                    st.rerun()
-            
-            with col3:
-                if st.button("🗑️ Eliminar", key=f"del_btn_gest_{row['id']}"):
-                    if st.session_state.get(f"confirm_del_gest_{row['id']}"):
-                        if delete_task_from_db(int(row['id'])):
-                            st.session_state.pop(f"confirm_del_gest_{row['id']}")
-                            st.success("Tarea eliminada")
-                            refresh_tasks()
-                            st.rerun()
-                    else:
-                        st.session_state[f"confirm_del_gest_{row['id']}"] = True
-                        st.warning("⚠️ Presiona de nuevo para confirmar")
-            
-            # EDICIÓN
-            if st.session_state.get(f"editing_gest_{row['id']}"):
-                with st.expander("✏️ Editar tarea", expanded=True):
-                    new_desc = st.text_area("Descripción", value=row['descripcion'], key=f"desc_gest_{row['id']}")
-                    new_cliente = st.text_input("Cliente", value=row['cliente'], key=f"cliente_gest_{row['id']}")
-                    new_date = st.date_input("Fecha objetivo", value=row['fecha_objetivo'], key=f"date_gest_{row['id']}")
-                    new_asignado = st.selectbox("Asignado", JEFES_PROYECTO, 
-                                               index=JEFES_PROYECTO.index(row['asignado']) if row['asignado'] in JEFES_PROYECTO else 0, 
-                                               key=f"asig_gest_{row['id']}")
-                    
-                    col_save, col_cancel = st.columns(2)
-                    with col_save:
-                        if st.button("💾 Guardar cambios", key=f"save_gest_{row['id']}"):
-                            updates = {
-                                'descripcion': new_desc,
-                                'cliente': new_cliente,
-                                'fecha_objetivo': new_date,
-                                'asignado': new_asignado
-                            }
-                            if update_task_in_db(int(row['id']), updates):
-                                st.session_state.pop(f"editing_gest_{row['id']}")
-                                st.success("Cambios guardados")
-                                refresh_tasks()
-                                st.rerun()
-                    
-                    with col_cancel:
-                        if st.button("❌ Cancelar", key=f"cancel_gest_{row['id']}"):
-                            st.session_state.pop(f"editing_gest_{row['id']}")
-                            st.rerun()
+        col_prev, col_info, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if len(cursores) > 1 and st.button("◀ Anterior", key="gest_prev"):
+                cursores.pop()
+                st.rerun()
+        with col_info:
+            st.caption(f"Página {len(cursores)}" + (f" de {max(1, -(-total // TASKS_PAGE_SIZE))}" if total is not None else ""))
+        with col_next:
+            if siguiente is not None and st.button("Siguiente ▶", key="gest_next"):
+                cursores.append(siguiente)
+                st.rerun()
+
+        for tarea in tareas:
+            tarjeta_tarea(tarea, "gest", comentarios=False)
 
 
 # ============================================================================
 # KPI GERENCIAL
 # ============================================================================
 
-def kpi_gerencial() -> None:
-    """Dashboard de KPIs gerenciales"""
+def kpi_gerencial(carga_tareas: Future) -> None:
+    """Dashboard de KPIs gerenciales
+
+    Las consultas de las tres pestañas se lanzan juntas mientras termina
+    ``carga_tareas`` (la carga del almacén, necesaria para la autonomía).
+    """
     st.markdown(
         """
         <div class='hero'>
@@ -878,27 +2868,39 @@ def kpi_gerencial() -> None:
     
     tabs = st.tabs(["📈 Dashboard Actual", "📝 Ingresar KPIs", "📅 Histórico"])
     
+    # Los filtros del histórico se dibujan primero para conocer su rango
+    with tabs[2]:
+        start_date, end_date, agrupacion = filtros_historico_kpis()
+    
+    # Los KPIs de la semana sirven al dashboard y al ingreso (semana = lunes)
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    kpis_semana = en_paralelo(load_kpis_from_db, monday, monday + timedelta(days=6))
+    rollup = en_paralelo(rollup_kpis, start_date, end_date, agrupacion)
+    carga_tareas.result()
+    
     # TAB 1: DASHBOARD ACTUAL
     with tabs[0]:
-        dashboard_kpi_actual()
+        dashboard_kpi_actual(kpis_semana)
     
     # TAB 2: INGRESAR KPIs
     with tabs[1]:
-        ingresar_kpis()
+        ingresar_kpis(kpis_semana)
     
     # TAB 3: HISTÓRICO
     with tabs[2]:
-        historico_kpis()
+        historico_kpis(rollup, agrupacion)
 
 
-def dashboard_kpi_actual() -> None:
-    """Dashboard de KPIs de la semana actual"""
+def dashboard_kpi_actual(kpis_semana: Future) -> None:
+    """Dashboard de KPIs de la semana actual (``kpis_semana`` de ``load_kpis_from_db``)"""
     today = date.today()
     monday = today - timedelta(days=today.weekday())
-    sunday = monday + timedelta(days=6)
     
-    # Cargar KPIs de la semana actual
-    kpis_df = load_kpis_from_db(monday, sunday)
+    # KPIs de la semana actual
+    kpis_df = kpis_semana.result()
+    if not kpis_df.empty:
+        kpis_df = kpis_df.assign(cumplimiento_kpi=calcular_cumplimiento_df(kpis_df))
     
     if kpis_df.empty:
         st.warning("⚠️ No hay datos de KPI para la semana actual. Ve a 'Ingresar KPIs' para agregar datos.")
@@ -936,99 +2938,7 @@ def dashboard_kpi_actual() -> None:
     # SECCIÓN B: GRÁFICOS PRINCIPALES
     st.markdown("### 📈 Indicadores por Persona")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # Gráfico Felicitaciones
-        st.subheader("Felicitaciones")
-        chart_data = kpis_df[['persona', 'felicitaciones']].copy()
-        chart_data['Meta'] = METAS_KPI['felicitaciones']
-        chart = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('persona:N', title=''),
-            y=alt.Y('felicitaciones:Q', title='Cantidad'),
-            color=alt.condition(
-                alt.datum.felicitaciones >= METAS_KPI['felicitaciones'],
-                alt.value('#22c55e'),
-                alt.value('#ef4444')
-            )
-        )
-        rule = alt.Chart(pd.DataFrame({'y': [METAS_KPI['felicitaciones']]})).mark_rule(color='#facc15', strokeDash=[5, 5]).encode(y='y:Q')
-        st.altair_chart(chart + rule, use_container_width=True)
-        
-        # Gráfico Orden
-        st.subheader("Orden (%)")
-        chart_data = kpis_df[['persona', 'orden']].copy()
-        chart = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('persona:N', title=''),
-            y=alt.Y('orden:Q', title='%', scale=alt.Scale(domain=[0, 100])),
-            color=alt.condition(
-                alt.datum.orden >= METAS_KPI['orden'],
-                alt.value('#22c55e'),
-                alt.value('#ef4444')
-            )
-        )
-        rule = alt.Chart(pd.DataFrame({'y': [METAS_KPI['orden']]})).mark_rule(color='#facc15', strokeDash=[5, 5]).encode(y='y:Q')
-        st.altair_chart(chart + rule, use_container_width=True)
-        
-        # Gráfico Autonomía
-        st.subheader("Autonomía (%)")
-        chart_data = kpis_df[['persona', 'autonomia']].copy()
-        chart = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('persona:N', title=''),
-            y=alt.Y('autonomia:Q', title='%', scale=alt.Scale(domain=[0, 100])),
-            color=alt.condition(
-                alt.datum.autonomia >= METAS_KPI['autonomia'],
-                alt.value('#22c55e'),
-                alt.value('#ef4444')
-            )
-        )
-        rule = alt.Chart(pd.DataFrame({'y': [METAS_KPI['autonomia']]})).mark_rule(color='#facc15', strokeDash=[5, 5]).encode(y='y:Q')
-        st.altair_chart(chart + rule, use_container_width=True)
-    
-    with col2:
-        # Gráfico Reclamos
-        st.subheader("Reclamos")
-        chart_data = kpis_df[['persona', 'reclamos']].copy()
-        chart = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('persona:N', title=''),
-            y=alt.Y('reclamos:Q', title='Cantidad'),
-            color=alt.condition(
-                alt.datum.reclamos <= METAS_KPI['reclamos'],
-                alt.value('#22c55e'),
-                alt.value('#ef4444')
-            )
-        )
-        rule = alt.Chart(pd.DataFrame({'y': [METAS_KPI['reclamos']]})).mark_rule(color='#facc15', strokeDash=[5, 5]).encode(y='y:Q')
-        st.altair_chart(chart + rule, use_container_width=True)
-        
-        # Gráfico Respuesta Cliente
-        st.subheader("Respuesta Cliente (%)")
-        chart_data = kpis_df[['persona', 'respuesta_cliente']].copy()
-        chart = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('persona:N', title=''),
-            y=alt.Y('respuesta_cliente:Q', title='%', scale=alt.Scale(domain=[0, 100])),
-            color=alt.condition(
-                alt.datum.respuesta_cliente >= METAS_KPI['respuesta_cliente'],
-                alt.value('#22c55e'),
-                alt.value('#ef4444')
-            )
-        )
-        rule = alt.Chart(pd.DataFrame({'y': [METAS_KPI['respuesta_cliente']]})).mark_rule(color='#facc15', strokeDash=[5, 5]).encode(y='y:Q')
-        st.altair_chart(chart + rule, use_container_width=True)
-        
-        # Gráfico Cumplimiento KPI
-        st.subheader("Cumplimiento KPI (%)")
-        chart_data = kpis_df[['persona', 'cumplimiento_kpi']].copy()
-        chart = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('persona:N', title=''),
-            y=alt.Y('cumplimiento_kpi:Q', title='%', scale=alt.Scale(domain=[0, 100])),
-            color=alt.condition(
-                alt.datum.cumplimiento_kpi >= 80,
-                alt.value('#22c55e'),
-                alt.value('#ef4444')
-            )
-        )
-        st.altair_chart(chart, use_container_width=True)
+    st.vega_lite_chart(spec_indicadores_kpi(kpis_formato_largo(kpis_df)), use_container_width=True)
     
     st.divider()
     
@@ -1083,8 +2993,8 @@ def dashboard_kpi_actual() -> None:
     st.dataframe(tabla_df, hide_index=True, use_container_width=True)
 
 
-def ingresar_kpis() -> None:
-    """Formulario para ingresar KPIs semanales"""
+def ingresar_kpis(kpis_semana: Future) -> None:
+    """Formulario para ingresar KPIs semanales (``kpis_semana``: los ya registrados)"""
     st.markdown("### 📝 Ingresar KPIs Semanales")
     
     today = date.today()
@@ -1092,11 +3002,16 @@ def ingresar_kpis() -> None:
     
     st.info(f"📅 Ingresando KPIs para la semana del {monday.strftime('%d/%m/%Y')}")
     
+    modo = st.radio("Modo de ingreso", ["Por persona", "Todo el equipo"], horizontal=True, key="kpi_modo")
+    if modo == "Todo el equipo":
+        ingresar_kpis_equipo(monday, kpis_semana.result())
+        return
+    
     # Seleccionar persona
     persona = st.selectbox("Selecciona persona", JEFES_PROYECTO)
     
     # Verificar si ya existen KPIs para esta semana y persona
-    kpis_existentes = load_kpis_from_db(monday, monday)
+    kpis_existentes = kpis_semana.result()
     if not kpis_existentes.empty and persona in kpis_existentes['persona'].values:
         st.warning(f"⚠️ Ya existen KPIs registrados para {persona} en esta semana. Serán reemplazados.")
     
@@ -1163,38 +3078,99 @@ def ingresar_kpis() -> None:
                 st.error("Error al guardar KPIs")
 
 
-def historico_kpis() -> None:
-    """Vista de histórico de KPIs"""
+def ingresar_kpis_equipo(monday: date, kpis_existentes: pd.DataFrame) -> None:
+    """Tabla editable con los KPIs de todos los jefes de proyecto de la semana"""
+    existentes = {}
+    if not kpis_existentes.empty:
+        existentes = {row['persona']: row for _, row in kpis_existentes.iterrows()}
+        st.warning("⚠️ Las personas con KPIs ya registrados esta semana se reemplazarán al guardar.")
+
+    autonomias = autonomia_por_persona(monday)
+    filas = []
+    for persona in JEFES_PROYECTO:
+        previo = existentes.get(persona)
+        filas.append({
+            'persona': persona,
+            'felicitaciones': float(previo['felicitaciones']) if previo is not None else 0.0,
+            'reclamos': int(previo['reclamos']) if previo is not None else 0,
+            'orden': float(previo['orden']) if previo is not None else 0.0,
+            'respuesta_cliente': float(previo['respuesta_cliente']) if previo is not None else 0.0,
+            'autonomia': autonomias.get(persona, 0.0),
+        })
+
+    with st.form("form_kpis_equipo"):
+        editado = st.data_editor(
+            pd.DataFrame(filas),
+            hide_index=True,
+            use_container_width=True,
+            disabled=['persona', 'autonomia'],
+            column_config={
+                'persona': st.column_config.TextColumn("Persona"),
+                'felicitaciones': st.column_config.NumberColumn(f"Felicitaciones (>{METAS_KPI['felicitaciones']})", min_value=0.0, max_value=100.0, step=1.0),
+                'reclamos': st.column_config.NumberColumn(f"Reclamos (<{METAS_KPI['reclamos']})", min_value=0, max_value=100, step=1),
+                'orden': st.column_config.NumberColumn(f"Orden % (>{METAS_KPI['orden']}%)", min_value=0.0, max_value=100.0, step=1.0),
+                'respuesta_cliente': st.column_config.NumberColumn(f"Respuesta Cliente % (>{METAS_KPI['respuesta_cliente']}%)", min_value=0.0, max_value=100.0, step=1.0),
+                'autonomia': st.column_config.NumberColumn("Autonomía % (automático)"),
+            },
+            key="editor_kpis_equipo",
+        )
+
+        if st.form_submit_button("💾 Guardar KPIs del equipo"):
+            editado = editado.fillna(0).assign(semana=monday.isoformat())
+            editado['reclamos'] = editado['reclamos'].astype(int)
+            editado['cumplimiento_kpi'] = calcular_cumplimiento_df(editado)
+            kpis = editado[['semana', 'persona', 'felicitaciones', 'reclamos', 'orden',
+                            'respuesta_cliente', 'autonomia', 'cumplimiento_kpi']].to_dict('records')
+
+            if save_kpis_batch_to_db(kpis):
+                st.success(f"✓ KPIs guardados para {len(kpis)} personas")
+            else:
+                st.error("Error al guardar KPIs")
+
+
+def filtros_historico_kpis() -> tuple[date, date, str]:
+    """Filtros del histórico; devuelve ``(start_date, end_date, agrupacion)``"""
     st.markdown("### 📅 Histórico de KPIs")
     
     # Filtros
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         periodo = st.selectbox("Período", ["Semana", "Mes", "Trimestre", "Año"])
     with col2:
+        today = date.today()
         if periodo == "Semana":
             weeks_back = st.number_input("Semanas atrás", min_value=1, max_value=52, value=4)
-            end_date = date.today()
-            start_date = end_date - timedelta(weeks=weeks_back)
+            end_date = today
+            start_date = today - timedelta(days=today.weekday(), weeks=weeks_back - 1)
         elif periodo == "Mes":
             months_back = st.number_input("Meses atrás", min_value=1, max_value=12, value=3)
-            end_date = date.today()
-            start_date = end_date - timedelta(days=months_back*30)
+            end_date = today
+            start_date = (pd.Period(today, freq="M") - (months_back - 1)).start_time.date()
         elif periodo == "Trimestre":
             quarter = st.selectbox("Trimestre", ["Q1", "Q2", "Q3", "Q4"])
-            year = st.number_input("Año", min_value=2020, max_value=2030, value=date.today().year)
-            q_start = {"Q1": 1, "Q2": 4, "Q3": 7, "Q4": 10}[quarter]
-            start_date = date(year, q_start, 1)
-            end_date = start_date + timedelta(days=90)
+            year = st.number_input("Año", min_value=2020, max_value=2030, value=today.year)
+            trimestre = pd.Period(f"{year}{quarter}", freq="Q")
+            start_date = trimestre.start_time.date()
+            end_date = trimestre.end_time.date()
         else:  # Año
-            year = st.number_input("Año", min_value=2020, max_value=2030, value=date.today().year)
+            year = st.number_input("Año", min_value=2020, max_value=2030, value=today.year)
             start_date = date(year, 1, 1)
             end_date = date(year, 12, 31)
+    with col3:
+        # Por defecto, puntos mensuales para rangos de más de un mes
+        agrupacion = st.selectbox(
+            "Agrupar por",
+            list(KPI_ROLLUP_FRECUENCIAS),
+            index=0 if periodo == "Semana" else 1,
+        )
+    return start_date, end_date, agrupacion
+
+
+def historico_kpis(rollup: Future, agrupacion: str) -> None:
+    """Vista de histórico de KPIs (``rollup`` de ``rollup_kpis`` por ``agrupacion``)"""
+    rollup_df = rollup.result()
     
-    # Cargar datos
-    kpis_df = load_kpis_from_db(start_date, end_date)
-    
-    if kpis_df.empty:
+    if rollup_df.empty:
         st.warning("No hay datos de KPI para el período seleccionado")
         return
     
@@ -1202,33 +3178,33 @@ def historico_kpis() -> None:
     persona_filtro = st.selectbox("Persona", ["Todos"] + JEFES_PROYECTO)
     
     if persona_filtro != "Todos":
-        kpis_df = kpis_df[kpis_df['persona'] == persona_filtro]
+        rollup_df = rollup_df[rollup_df['persona'] == persona_filtro]
     
     # Gráficos de tendencia
     st.subheader("📈 Tendencias")
     
     # Gráfico de Cumplimiento KPI
-    chart = alt.Chart(kpis_df).mark_line(point=True).encode(
-        x=alt.X('semana:T', title='Fecha'),
+    chart = alt.Chart(rollup_df).mark_line(point=True).encode(
+        x=alt.X('periodo:T', title=agrupacion),
         y=alt.Y('cumplimiento_kpi:Q', title='Cumplimiento KPI (%)', scale=alt.Scale(domain=[0, 100])),
         color='persona:N',
-        tooltip=['persona', 'semana', 'cumplimiento_kpi']
+        tooltip=['persona', 'periodo', 'semanas', 'cumplimiento_kpi']
     ).properties(height=300)
     st.altair_chart(chart, use_container_width=True)
     
     # Gráfico de Autonomía
-    chart_autonomia = alt.Chart(kpis_df).mark_line(point=True).encode(
-        x=alt.X('semana:T', title='Fecha'),
+    chart_autonomia = alt.Chart(rollup_df).mark_line(point=True).encode(
+        x=alt.X('periodo:T', title=agrupacion),
         y=alt.Y('autonomia:Q', title='Autonomía (%)', scale=alt.Scale(domain=[0, 100])),
         color='persona:N',
-        tooltip=['persona', 'semana', 'autonomia']
+        tooltip=['persona', 'periodo', 'semanas', 'autonomia']
     ).properties(height=300)
     st.altair_chart(chart_autonomia, use_container_width=True)
     
     # Tabla histórica
     st.subheader("📋 Datos Históricos")
-    display_df = kpis_df[['semana', 'persona', 'felicitaciones', 'reclamos', 'orden', 'autonomia', 'respuesta_cliente', 'cumplimiento_kpi']].copy()
-    display_df['semana'] = pd.to_datetime(display_df['semana']).dt.strftime('%d/%m/%Y')
+    display_df = rollup_df[['periodo', 'persona', 'semanas', 'felicitaciones', 'reclamos', 'orden', 'autonomia', 'respuesta_cliente', 'cumplimiento_kpi']].copy()
+    display_df['periodo'] = display_df['periodo'].dt.strftime('%d/%m/%Y')
     st.dataframe(display_df, hide_index=True, use_container_width=True)
 
 
@@ -1236,7 +3212,7 @@ def historico_kpis() -> None:
 # VISTA JEFE DE PROYECTO
 # ============================================================================
 
-def jp_view(nombre: str, df: pd.DataFrame) -> None:
+def jp_view(nombre: str) -> None:
     today = date.today()
     monday = today - timedelta(days=today.weekday())
     sunday = monday + timedelta(days=6)
@@ -1265,138 +3241,43 @@ def jp_view(nombre: str, df: pd.DataFrame) -> None:
                         "autor": st.session_state.user_info["nombre"],
                         "asignado": asignado,
                         "cliente": cliente.strip(),
-                        "comentarios": []
                     }
                     
                     if save_task_to_db(nueva_tarea):
                         st.success("✓ Tarea creada exitosamente")
-                        refresh_tasks()
                         st.rerun()
                     else:
                         st.error("Error al crear la tarea")
                 else:
                     st.error("❌ Descripción y cliente son obligatorios.")
 
+    importar_tareas_ui(f"import_{nombre}")
+
     # FILTRO DE BÚSQUEDA
-    search = st.text_input("🔍 Buscar tarea (descripción o cliente)", key=f"search_{nombre}")
-    
-    active_df = df[(df["estado"] != "Completada") & (df["asignado"] == nombre)].copy()
+    search = st.text_input("🔍 Buscar tarea (descripción, cliente o comentarios)", key=f"search_{nombre}")
     
-    # Aplicar filtro de búsqueda
-    if search:
-        mask = (
-            active_df['descripcion'].str.contains(search, case=False, na=False) |
-            active_df['cliente'].str.contains(search, case=False, na=False)
-        )
-        active_df = active_df[mask]
-        if active_df.empty:
-            st.info(f"No se encontraron tareas con '{search}'")
+    # Tareas abiertas de esta persona, filtradas sobre el almacén compartido
+    filtros = {"persona": nombre, "excluir_estado": "Completada"}
+    if search.strip():
+        filtros["ids"] = buscar_tareas(search, filtros)
+    active_df = filter_task_frame(to_df(), filtros)
+    if search and active_df.empty:
+        st.info(f"No se encontraron tareas con '{search}'")
 
     # TAREAS DE LA SEMANA ACTUAL
     st.subheader("Tareas de la semana actual")
-    week_df = active_df[(active_df["fecha_objetivo"] >= monday) & (active_df["fecha_objetivo"] <= sunday)]
+    fechas = active_df["fecha_objetivo"]
+    hoy = pd.Timestamp(today)
+    week_df = active_df[fechas.between(pd.Timestamp(monday), pd.Timestamp(sunday))]
     if week_df.empty:
         st.caption("Sin tareas operativas para esta semana.")
     else:
-        for _, row in week_df.sort_values("fecha_objetivo").iterrows():
-            task_card(row)
-            
-            col1, col2, col3 = st.columns([2, 1, 1])
-            
-            with col1:
-                new_status = st.selectbox(
-                    f"Estado",
-                    options=ESTADOS,
-                    index=ESTADOS.index(row["estado"]),
-                    key=f"status_{nombre}_{row['id']}",
-                )
-                if new_status != row["estado"]:
-                    if update_task_in_db(int(row["id"]), {"estado": new_status}):
-                        st.success("Estado actualizado")
-                        refresh_tasks()
-                        st.rerun()
-            
-            with col2:
-                if puede_editar_tarea(row.to_dict()):
-                    if st.button("✏️ Editar", key=f"edit_btn_{row['id']}"):
-                        st.session_state[f"editing_{row['id']}"] = True
-                        st.rerun()
-            
-            with col3:
-                if puede_eliminar_tarea(row.to_dict()):
-                    if st.button("🗑️ Eliminar", key=f"del_btn_{row['id']}"):
-                        if st.session_state.get(f"confirm_del_{row['id']}"):
-                            if delete_task_from_db(int(row['id'])):
-                                st.session_state.pop(f"confirm_del_{row['id']}")
-                                st.success("Tarea eliminada")
-                                refresh_tasks()
-                                st.rerun()
-                        else:
-                            st.session_state[f"confirm_del_{row['id']}"] = True
-                            st.warning("⚠️ Presiona de nuevo para confirmar")
-            
-            # EDICIÓN DE TAREA
-            if st.session_state.get(f"editing_{row['id']}") and puede_editar_tarea(row.to_dict()):
-                with st.expander("✏️ Editar tarea", expanded=True):
-                    new_desc = st.text_area("Descripción", value=row['descripcion'], key=f"desc_{row['id']}")
-                    new_cliente = st.text_input("Cliente", value=row['cliente'], key=f"cliente_{row['id']}")
-                    new_date = st.date_input("Fecha objetivo", value=row['fecha_objetivo'], key=f"date_{row['id']}")
-                    new_asignado = st.selectbox("Asignado", JEFES_PROYECTO, 
-                                               index=JEFES_PROYECTO.index(row['asignado']) if row['asignado'] in JEFES_PROYECTO else 0, 
-                                               key=f"asig_{row['id']}")
-                    
-                    col_save, col_cancel = st.columns(2)
-                    with col_save:
-                        if st.button("💾 Guardar cambios", key=f"save_{row['id']}"):
-                            updates = {
-                                'descripcion': new_desc,
-                                'cliente': new_cliente,
-                                'fecha_objetivo': new_date,
-                                'asignado': new_asignado
-                            }
-                            if update_task_in_db(int(row['id']), updates):
-                                st.session_state.pop(f"editing_{row['id']}")
-                                st.success("Cambios guardados")
-                                refresh_tasks()
-                                st.rerun()
-                    
-                    with col_cancel:
-                        if st.button("❌ Cancelar", key=f"cancel_{row['id']}"):
-                            st.session_state.pop(f"editing_{row['id']}")
-                            st.rerun()
-            
-            # COMENTARIOS
-            task = next((t for t in st.session_state.tasks if t['id'] == int(row['id'])), None)
-            if task and task.get('comentarios'):
-                with st.expander(f"💬 Comentarios ({len(task['comentarios'])})"):
-                    for com in task['comentarios']:
-                        com_date = datetime.fromisoformat(com['fecha']).strftime("%d/%m/%Y %H:%M")
-                        st.caption(f"**{com['autor']}** - {com_date}")
-                        st.write(com['texto'])
-                        st.divider()
-            
-            # Agregar comentario
-            with st.expander("➕ Agregar comentario"):
-                comment_text = st.text_area("Comentario", key=f"comment_{row['id']}")
-                if st.button("Publicar", key=f"post_comment_{row['id']}"):
-                    if comment_text.strip():
-                        task = next((t for t in st.session_state.tasks if t['id'] == int(row['id'])), None)
-                        if task:
-                            if 'comentarios' not in task:
-                                task['comentarios'] = []
-                            task['comentarios'].append({
-                                'autor': st.session_state.user_info["nombre"],
-                                'fecha': datetime.now().isoformat(),
-                                'texto': comment_text.strip()
-                            })
-                            if update_task_in_db(int(row['id']), {'comentarios': task['comentarios']}):
-                                st.success("Comentario agregado")
-                                refresh_tasks()
-                                st.rerun()
+        for task_id in week_df.sort_values("fecha_objetivo")["id"]:
+            tarjeta_tarea(find_task(int(task_id)), nombre)
 
     # PRÓXIMAS SEMANAS (BACKLOG)
     st.subheader("Próximas semanas (backlog)")
-    backlog_df = active_df[active_df["fecha_objetivo"] > sunday]
+    backlog_df = active_df[fechas > pd.Timestamp(sunday)]
     if backlog_df.empty:
         st.caption("✓ Backlog despejado.")
     else:
@@ -1405,112 +3286,12 @@ def jp_view(nombre: str, df: pd.DataFrame) -> None:
 
     # TAREAS ATRASADAS
     st.subheader("Tareas atrasadas")
-    late_df = active_df[active_df["fecha_objetivo"] < today]
+    late_df = active_df[fechas < hoy]
     if late_df.empty:
         st.caption("✓ Sin atrasos.")
     else:
-        for _, row in late_df.sort_values("fecha_objetivo").iterrows():
-            days = (today - row["fecha_objetivo"]).days
-            cls = "risk-yellow" if days <= 3 else "risk-red"
-            st.markdown(
-                f"<div class='task {cls}'><strong>{row['descripcion']}</strong><br>"
-                f"⏰ Días de atraso: <strong>{days}</strong> · Autor: {row['autor']} · Cliente: {row['cliente']}</div>",
-                unsafe_allow_html=True,
-            )
-            
-            # Controles interactivos para tareas atrasadas
-            col1, col2, col3 = st.columns([2, 1, 1])
-            
-            with col1:
-                new_status = st.selectbox(
-                    f"Estado",
-                    options=ESTADOS,
-                    index=ESTADOS.index(row["estado"]),
-                    key=f"status_late_{nombre}_{row['id']}",
-                )
-                if new_status != row["estado"]:
-                    if update_task_in_db(int(row["id"]), {"estado": new_status}):
-                        st.success("Estado actualizado")
-                        refresh_tasks()
-                        st.rerun()
-            
-            with col2:
-                if puede_editar_tarea(row.to_dict()):
-                    if st.button("✏️ Editar", key=f"edit_btn_late_{row['id']}"):
-                        st.session_state[f"editing_late_{row['id']}"] = True
-                        st.rerun()
-            
-            with col3:
-                if puede_eliminar_tarea(row.to_dict()):
-                    if st.button("🗑️ Eliminar", key=f"del_btn_late_{row['id']}"):
-                        if st.session_state.get(f"confirm_del_late_{row['id']}"):
-                            if delete_task_from_db(int(row['id'])):
-                                st.session_state.pop(f"confirm_del_late_{row['id']}")
-                                st.success("Tarea eliminada")
-                                refresh_tasks()
-                                st.rerun()
-                        else:
-                            st.session_state[f"confirm_del_late_{row['id']}"] = True
-                            st.warning("⚠️ Presiona de nuevo para confirmar")
-            
-            # EDICIÓN DE TAREA ATRASADA
-            if st.session_state.get(f"editing_late_{row['id']}") and puede_editar_tarea(row.to_dict()):
-                with st.expander("✏️ Editar tarea", expanded=True):
-                    new_desc = st.text_area("Descripción", value=row['descripcion'], key=f"desc_late_{row['id']}")
-                    new_cliente = st.text_input("Cliente", value=row['cliente'], key=f"cliente_late_{row['id']}")
-                    new_date = st.date_input("Fecha objetivo", value=row['fecha_objetivo'], key=f"date_late_{row['id']}")
-                    new_asignado = st.selectbox("Asignado", JEFES_PROYECTO, 
-                                               index=JEFES_PROYECTO.index(row['asignado']) if row['asignado'] in JEFES_PROYECTO else 0, 
-                                               key=f"asig_late_{row['id']}")
-                    
-                    col_save, col_cancel = st.columns(2)
-                    with col_save:
-                        if st.button("💾 Guardar cambios", key=f"save_late_{row['id']}"):
-                            updates = {
-                                'descripcion': new_desc,
-                                'cliente': new_cliente,
-                                'fecha_objetivo': new_date,
-                                'asignado': new_asignado
-                            }
-                            if update_task_in_db(int(row['id']), updates):
-                                st.session_state.pop(f"editing_late_{row['id']}")
-                                st.success("Cambios guardados")
-                                refresh_tasks()
-                                st.rerun()
-                    
-                    with col_cancel:
-                        if st.button("❌ Cancelar", key=f"cancel_late_{row['id']}"):
-                            st.session_state.pop(f"editing_late_{row['id']}")
-                            st.rerun()
-            
-            # COMENTARIOS EN TAREAS ATRASADAS
-            task = next((t for t in st.session_state.tasks if t['id'] == int(row['id'])), None)
-            if task and task.get('comentarios'):
-                with st.expander(f"💬 Comentarios ({len(task['comentarios'])})"):
-                    for com in task['comentarios']:
-                        com_date = datetime.fromisoformat(com['fecha']).strftime("%d/%m/%Y %H:%M")
-                        st.caption(f"**{com['autor']}** - {com_date}")
-                        st.write(com['texto'])
-                        st.divider()
-            
-            # Agregar comentario a tarea atrasada
-            with st.expander("➕ Agregar comentario"):
-                comment_text = st.text_area("Comentario", key=f"comment_late_{row['id']}")
-                if st.button("Publicar", key=f"post_comment_late_{row['id']}"):
-                    if comment_text.strip():
-                        task = next((t for t in st.session_state.tasks if t['id'] == int(row['id'])), None)
-                        if task:
-                            if 'comentarios' not in task:
-                                task['comentarios'] = []
-                            task['comentarios'].append({
-                                'autor': st.session_state.user_info["nombre"],
-                                'fecha': datetime.now().isoformat(),
-                                'texto': comment_text.strip()
-                            })
-                            if update_task_in_db(int(row['id']), {'comentarios': task['comentarios']}):
-                                st.success("Comentario agregado")
-                                refresh_tasks()
-                                st.rerun()
+        for task_id in late_df.sort_values("fecha_objetivo")["id"]:
+            tarjeta_tarea(find_task(int(task_id)), f"late_{nombre}", atraso=True)
 
 
 # ============================================================================
@@ -1525,8 +3306,6 @@ def main() -> None:
     
     # Usuario autenticado
     inject_css()
-    init_data()
-    df = to_df()
     
     # SIDEBAR
     with st.sidebar:
@@ -1550,7 +3329,7 @@ def main() -> None:
         option = st.radio("Ir a", menu_options)
         
         st.divider()
-        st.caption(f"Total de tareas: {len(st.session_state.tasks)}")
+        total_tareas = st.empty()
         
         # Cambiar contraseña
         with st.expander("🔑 Cambiar contraseña"):
@@ -1582,15 +3361,45 @@ def main() -> None:
         if st.button("🚪 Cerrar Sesión", use_container_width=True):
             logout()
     
+    # Con DASHBOARD_FUENTE = "rpc" el dashboard no usa el almacén de tareas
+    usa_almacen = option != "Dashboard Gerencia" or DASHBOARD_FUENTE == "local"
+    # Si hay que ir a Supabase, la carga de tareas corre en el pool; las
+    # vistas que usan el almacén la esperan y las demás lanzan sus consultas
+    # en paralelo. Si el almacén está al día no se ocupa un hilo del pool.
+    if usa_almacen and tareas_por_sincronizar():
+        carga_tareas = en_paralelo(init_data)
+    else:
+        if usa_almacen:
+            init_data()
+        carga_tareas = Future()
+        carga_tareas.set_result(None)
+    if get_circuit_breaker().abierto:
+        st.warning("⚠️ Supabase no responde: se muestran los últimos datos cargados y los cambios pueden fallar.")
+    
     # Renderizar vista según selección
     if option == "Dashboard Gerencia":
-        dashboard_gerencia(df)
+        if usa_almacen:
+            carga_tareas.result()
+            dashboard_gerencia(to_df())
+        else:
+            dashboard_gerencia(None)
     elif option == "Gestión de Tareas":
-        gestion_tareas_gerentes(df)
+        carga_tareas.result()
+        gestion_tareas_gerentes()
     elif option == "KPI Gerencial":
-        kpi_gerencial()
+        kpi_gerencial(carga_tareas)
+    else:
+        carga_tareas.result()
+        jp_view(option)
+    
+    if usa_almacen:
+        carga_tareas.result()
+        total_tareas.caption(f"Total de tareas: {len(get_tasks())}")
     else:
-        jp_view(option, df)
+        try:
+            total_tareas.caption(f"Total de tareas: {total_tareas_rpc()}")
+        except Exception as e:
+            total_tareas.caption(f"Total de tareas: sin conexión ({e})")
 
 
 if __name__ == "__main__":
@@ -15,46 +15,203 @@ CREATE TABLE IF NOT EXISTS tareas (
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- 1b. Bases creadas con una versión anterior (p. ej. desde el Table Editor)
+ALTER TABLE tareas ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
 -- 2. Crear índices para mejor rendimiento
 CREATE INDEX IF NOT EXISTS idx_tareas_asignado ON tareas(asignado);
 CREATE INDEX IF NOT EXISTS idx_tareas_fecha ON tareas(fecha_objetivo);
 CREATE INDEX IF NOT EXISTS idx_tareas_estado ON tareas(estado);
+CREATE INDEX IF NOT EXISTS idx_tareas_updated_at ON tareas(updated_at);
+
+-- 2b. Mantener updated_at al modificar una fila
+-- La app sincroniza solo las filas con updated_at posterior a la última
+-- sincronización, así que cada UPDATE debe mover esta marca.
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tareas_updated_at ON tareas;
+CREATE TRIGGER trg_tareas_updated_at
+BEFORE UPDATE ON tareas
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
 -- 3. Habilitar Row Level Security
 ALTER TABLE tareas ENABLE ROW LEVEL SECURITY;
 
 -- 4. Crear políticas de acceso (permite todo para simplicidad)
--- En producción deberías hacer políticas más restrictivas
+-- En producción deberías hacer políticas más restrictivas. Cada política se
+-- elimina antes de crearla para poder volver a ejecutar el script completo
+-- sobre una base existente y aplicar las migraciones de más abajo.
 
 -- Política de SELECT (leer)
+DROP POLICY IF EXISTS "Permitir SELECT para todos" ON tareas;
 CREATE POLICY "Permitir SELECT para todos"
 ON tareas FOR SELECT
 USING (true);
 
 -- Política de INSERT (crear)
+DROP POLICY IF EXISTS "Permitir INSERT para todos" ON tareas;
 CREATE POLICY "Permitir INSERT para todos"
 ON tareas FOR INSERT
 WITH CHECK (true);
 
 -- Política de UPDATE (actualizar)
+DROP POLICY IF EXISTS "Permitir UPDATE para todos" ON tareas;
 CREATE POLICY "Permitir UPDATE para todos"
 ON tareas FOR UPDATE
 USING (true)
 WITH CHECK (true);
 
 -- Política de DELETE (eliminar)
+DROP POLICY IF EXISTS "Permitir DELETE para todos" ON tareas;
 CREATE POLICY "Permitir DELETE para todos"
 ON tareas FOR DELETE
 USING (true);
 
--- 5. Insertar datos de ejemplo (opcional)
+-- 4b. Comentarios en su propia tabla (solo se agregan filas)
+-- Reemplaza el arreglo JSON de tareas.comentarios: publicar un comentario es
+-- un INSERT de una fila y dos personas comentando a la vez ya no se pisan.
+ALTER TABLE tareas ADD COLUMN IF NOT EXISTS num_comentarios INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS comentarios (
+    id BIGSERIAL PRIMARY KEY,
+    tarea_id BIGINT NOT NULL REFERENCES tareas(id) ON DELETE CASCADE,
+    autor TEXT NOT NULL,
+    texto TEXT NOT NULL,
+    fecha TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_comentarios_tarea ON comentarios(tarea_id, fecha);
+
+ALTER TABLE comentarios ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Permitir SELECT comentarios para todos" ON comentarios;
+CREATE POLICY "Permitir SELECT comentarios para todos"
+ON comentarios FOR SELECT
+USING (true);
+
+DROP POLICY IF EXISTS "Permitir INSERT comentarios para todos" ON comentarios;
+CREATE POLICY "Permitir INSERT comentarios para todos"
+ON comentarios FOR INSERT
+WITH CHECK (true);
+
+-- Mantener el contador en tareas (también mueve updated_at vía el trigger,
+-- así la sincronización incremental ve el comentario nuevo)
+CREATE OR REPLACE FUNCTION contar_comentario()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE tareas SET num_comentarios = num_comentarios + 1 WHERE id = NEW.tarea_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_comentarios_contar ON comentarios;
+CREATE TRIGGER trg_comentarios_contar
+AFTER INSERT ON comentarios
+FOR EACH ROW EXECUTE FUNCTION contar_comentario();
+
+-- Migración: copiar los comentarios existentes del JSON a la tabla nueva.
+-- Solo toca tareas que aún no tienen filas en comentarios, así que se puede
+-- volver a ejecutar sin duplicar. El trigger se desactiva durante la copia
+-- masiva y el contador se recalcula una sola vez al final.
+ALTER TABLE comentarios DISABLE TRIGGER trg_comentarios_contar;
+
+INSERT INTO comentarios (tarea_id, autor, texto, fecha)
+SELECT t.id, c->>'autor', c->>'texto', (c->>'fecha')::timestamptz
+FROM tareas t
+CROSS JOIN LATERAL jsonb_array_elements(COALESCE(NULLIF(t.comentarios, ''), '[]')::jsonb) AS c
+WHERE NOT EXISTS (SELECT 1 FROM comentarios x WHERE x.tarea_id = t.id);
+
+ALTER TABLE comentarios ENABLE TRIGGER trg_comentarios_contar;
+
+UPDATE tareas t
+SET num_comentarios = sub.total
+FROM (SELECT tarea_id, COUNT(*) AS total FROM comentarios GROUP BY tarea_id) AS sub
+WHERE sub.tarea_id = t.id AND t.num_comentarios <> sub.total;
+
+-- La columna tareas.comentarios queda solo como respaldo; la app ya no la
+-- lee ni la escribe. Una vez verificada la migración se puede eliminar:
+-- ALTER TABLE tareas DROP COLUMN comentarios;
+
+-- 4c. Agregados del dashboard (llamados con supabase.rpc)
+-- Devuelven pocas filas ya agregadas en vez de la tabla completa.
+
+-- Conteo de tareas por día, persona y estado en un rango de fechas
+CREATE OR REPLACE FUNCTION dashboard_conteos(desde DATE, hasta DATE)
+RETURNS TABLE (fecha_objetivo DATE, asignado TEXT, estado TEXT, total BIGINT)
+LANGUAGE sql STABLE AS $$
+    SELECT t.fecha_objetivo, t.asignado, t.estado, COUNT(*)
+    FROM tareas t
+    WHERE t.fecha_objetivo BETWEEN desde AND hasta
+    GROUP BY t.fecha_objetivo, t.asignado, t.estado;
+$$;
+
+-- Tareas atrasadas (vencidas y no completadas) con sus días de atraso
+CREATE OR REPLACE FUNCTION tareas_atrasadas(hoy DATE DEFAULT CURRENT_DATE)
+RETURNS TABLE (id BIGINT, descripcion TEXT, asignado TEXT, fecha_objetivo DATE, dias_atraso INTEGER)
+LANGUAGE sql STABLE AS $$
+    SELECT t.id, t.descripcion, t.asignado, t.fecha_objetivo, (hoy - t.fecha_objetivo)
+    FROM tareas t
+    WHERE t.fecha_objetivo < hoy AND t.estado <> 'Completada'
+    ORDER BY 5 DESC, t.id;
+$$;
+
+-- 4d. KPIs semanales por persona
+CREATE TABLE IF NOT EXISTS kpis (
+    id BIGSERIAL PRIMARY KEY,
+    semana DATE NOT NULL,
+    persona TEXT NOT NULL,
+    felicitaciones NUMERIC NOT NULL DEFAULT 0,
+    reclamos INTEGER NOT NULL DEFAULT 0,
+    orden NUMERIC NOT NULL DEFAULT 0,
+    respuesta_cliente NUMERIC NOT NULL DEFAULT 0,
+    autonomia NUMERIC NOT NULL DEFAULT 0,
+    cumplimiento_kpi NUMERIC NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Antes solo se insertaba, así que puede haber varias filas por semana y
+-- persona: se conserva la más reciente y se agrega la clave única que usa
+-- el upsert de la app (on_conflict = semana, persona).
+DELETE FROM kpis a
+USING kpis b
+WHERE a.semana = b.semana AND a.persona = b.persona AND a.id < b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_kpis_semana_persona ON kpis(semana, persona);
+
+ALTER TABLE kpis ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Permitir SELECT kpis para todos" ON kpis;
+CREATE POLICY "Permitir SELECT kpis para todos"
+ON kpis FOR SELECT
+USING (true);
+
+DROP POLICY IF EXISTS "Permitir INSERT kpis para todos" ON kpis;
+CREATE POLICY "Permitir INSERT kpis para todos"
+ON kpis FOR INSERT
+WITH CHECK (true);
+
+DROP POLICY IF EXISTS "Permitir UPDATE kpis para todos" ON kpis;
+CREATE POLICY "Permitir UPDATE kpis para todos"
+ON kpis FOR UPDATE
+USING (true)
+WITH CHECK (true);
+
+-- 5. Insertar datos de ejemplo (opcional, solo si la tabla está vacía)
 INSERT INTO tareas (descripcion, fecha_objetivo, estado, autor, asignado, cliente, comentarios)
-VALUES 
+SELECT * FROM (VALUES 
     ('Revisión final contrato soporte anual', CURRENT_DATE, 'En Proceso', 'Gerente de Proyectos', 'Julio Yroba', 'Innova SA', '[]'),
     ('Validar backlog Q4 con equipo técnico', CURRENT_DATE + INTERVAL '1 day', 'Pendiente', 'Gerente de Proyectos', 'José Quintero', 'Norte Digital', '[]'),
     ('Actualizar cronograma integración ERP', CURRENT_DATE + INTERVAL '2 days', 'Pendiente', 'Julio Yroba', 'Matías Riquelme', 'MetalSur', '[]'),
     ('Informe de avance para comité mensual', CURRENT_DATE + INTERVAL '3 days', 'En Proceso', 'José Quintero', 'José Quintero', 'Gerencia Interna', '[]'),
-    ('Kickoff mejora dashboard comercial', CURRENT_DATE, 'Pendiente', 'Julio Yroba', 'Julio Yroba', 'Comercial Plus', '[]');
+    ('Kickoff mejora dashboard comercial', CURRENT_DATE, 'Pendiente', 'Julio Yroba', 'Julio Yroba', 'Comercial Plus', '[]')
+) AS ejemplo (descripcion, fecha_objetivo, estado, autor, asignado, cliente, comentarios)
+WHERE NOT EXISTS (SELECT 1 FROM tareas);
 
 -- Verificar que todo se creó correctamente
 SELECT 'Tabla creada exitosamente' AS mensaje;